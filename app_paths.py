@@ -0,0 +1,17 @@
+import os
+import sys
+
+APP_NAME = "3xp3dition-audio"
+
+def get_cache_dir(*parts):
+    root = os.environ.get("EXPEDITION_AUDIO_CACHE")
+    if not root:
+        if sys.platform == "win32":
+            base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        else:
+            base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+        root = os.path.join(base, APP_NAME)
+
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
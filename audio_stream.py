@@ -0,0 +1,881 @@
+import os
+import struct
+import threading
+import time
+import numpy as np
+import soundfile as sf
+from resampler import StreamingResampler, downmix
+from metrics import REGISTRY
+from seek_index import IndexedMp3Source
+
+BLOCK_FRAMES = 4096
+BUFFER_FRAMES = 1 << 17
+SAFETY_MARGIN_FRAMES = 44100 * 2
+# 0-d arrays: a Python or numpy scalar operand makes the ufunc allocate a conversion every call
+PCM16_SCALE = np.array(1 / 32768, dtype=np.float32)
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+LIMITER_CEILING = 10 ** (-1 / 20)
+LIMITER_LOOKAHEAD_SECONDS = 0.0015
+LIMITER_RELEASE_SECONDS = 0.08
+
+DECODE_SECONDS = REGISTRY.counter("decode_seconds_total", "Wall time spent decoding and resampling")
+DECODED_AUDIO_SECONDS = REGISTRY.counter("decoded_audio_seconds_total", "Audio decoded, in seconds of playback")
+REGISTRY.gauge("decode_realtime_factor", "Seconds of audio decoded per second spent decoding",
+               fn=lambda: DECODED_AUDIO_SECONDS.value / DECODE_SECONDS.value if DECODE_SECONDS.value else 0)
+
+class RingBuffer:
+    def __init__(self, capacity=BUFFER_FRAMES, channels=2):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.read_index = 0
+        self.write_index = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+        self._views = {}
+        self._view_frames = 0
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def space(self):
+        return self.capacity - self.available()
+
+    def write(self, block, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return -1
+
+            count = min(len(block), self.space())
+            start = self.write_index % self.capacity
+            first = min(count, self.capacity - start)
+            self.data[start:start + first] = block[:first]
+            self.data[:count - first] = block[first:count]
+            self.write_index += count
+            return count
+
+    def read_into(self, out):
+        # acquire/release rather than `with`, which allocates a bound __exit__ on every callback
+        self.lock.acquire()
+        try:
+            # frame counts are boxed ints, so a full read keeps none of them in locals
+            if len(out) and self.available() >= len(out):
+                window = self._window(self.read_index % self.capacity, len(out))
+                if window is not None:
+                    np.copyto(out, window)
+                    self.read_index += len(out)
+                    return len(out)
+            count = min(len(out), self.available())
+            start = self.read_index % self.capacity
+            first = min(count, self.capacity - start)
+            out[:first] = self.data[start:start + first]
+            out[first:count] = self.data[:count - first]
+            self.read_index += count
+            return count
+        finally:
+            self.lock.release()
+
+    def _window(self, start, frames):
+        if frames != self._view_frames:
+            self._make_views(frames)
+        window = self._views.get(start)
+        if window is None and start + frames <= self.capacity and len(self._views) < 4 * self.capacity // frames:
+            # a short read left the reader off the grid
+            window = self._views[start] = self.data[start:start + frames]
+        return window
+
+    def _make_views(self, frames):
+        # views of the storage for full reads of the callback's block size, made once per size; kept out
+        # of _window, whose every call would otherwise build the comprehension's closure cells
+        self._view_frames = frames
+        self._views = {offset: self.data[offset:offset + frames]
+                       for offset in range(0, self.capacity - frames + 1, frames)}
+
+    def clear(self):
+        with self.lock:
+            return self._clear()
+
+    def _clear(self):
+        self.read_index = self.write_index = 0
+        self.generation += 1
+        return self.generation
+
+class GrowingWavSource:
+    def __init__(self, path, is_complete, total_frames=0, margin_frames=SAFETY_MARGIN_FRAMES, final_path=None):
+        self.path = path
+        self.is_complete = is_complete
+        # where the finished rip ended up, when it moves off `path`
+        self.final_path = final_path
+        self.frames = total_frames
+        self.margin_frames = margin_frames
+        self.samplerate = 44100
+        self.channels = 2
+        self.block_align = 4
+        self.data_offset = None
+        self.position = 0
+        self.file = None
+        self.ready = False
+
+    @property
+    def pending(self):
+        # a rip that finished after the last read may have written more, or moved the file
+        if not self.is_complete():
+            return True
+        return self.file is not None and (self.position < self.available_frames() or self._replaced(True))
+
+    def wait_ready(self, timeout=30, poll=0.05):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            complete = self.is_complete()
+            if self._open(complete):
+                if self._buffered(complete):
+                    self.ready = True
+                    return True
+            elif complete:
+                return False
+            time.sleep(poll)
+        return False
+
+    def available_frames(self):
+        if self.file is None:
+            return 0
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+        except (OSError, ValueError):
+            return 0
+        frames = max(0, (size - self.data_offset) // self.block_align)
+        if self.frames:
+            frames = min(frames, self.frames)
+        return frames
+
+    def seek(self, frame):
+        self.position = max(0, min(frame, self.available_frames()))
+        return self.position
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        complete = self.is_complete()
+        if self.file is not None and self.position >= self.available_frames() and self._replaced(complete):
+            self.close()
+        count = 0
+        # until enough is on disk to play without running dry, reads come back empty and the decoder waits
+        if self._open(complete) and (self.ready or self._buffered(complete)):
+            self.ready = True
+            count = max(0, min(frames, self.available_frames() - self.position))
+        raw = b''
+        if count:
+            self.file.seek(self.data_offset + self.position * self.block_align)
+            raw = self.file.read(count * self.block_align)
+        count = len(raw) // self.block_align
+        self.position += count
+
+        samples = np.frombuffer(raw, dtype='<i2', count=count * self.channels)
+        block = np.empty((count, self.channels), dtype=dtype)
+        np.multiply(samples.reshape(count, self.channels), 1 / 32768, out=block, casting='unsafe')
+        return block
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _buffered(self, complete):
+        wanted = min(self.margin_frames, self.frames) if self.frames else self.margin_frames
+        return complete or self.available_frames() >= wanted
+
+    def _target(self, complete):
+        if complete and self.final_path:
+            return self.final_path() or self.path
+        return self.path
+
+    def _replaced(self, complete):
+        # a preempted rip starts over in a new file, and a finished one may have moved into the cache
+        try:
+            return not os.path.samestat(os.stat(self._target(complete)), os.fstat(self.file.fileno()))
+        except (OSError, ValueError):
+            return False
+
+    def _open(self, complete=False):
+        if self.file:
+            return True
+        try:
+            f = open(self._target(complete), 'rb')
+        except OSError:
+            return False
+
+        if self._parse_header(f):
+            self.file = f
+            return True
+        f.close()
+        return False
+
+    def _parse_header(self, f):
+        header = read_wav_header(f)
+        if not header:
+            return False
+        self.channels, self.samplerate, self.block_align, self.data_offset, _ = header
+        return True
+
+def read_wav_header(f):
+    riff = f.read(12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+        return None
+
+    fmt = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, size = struct.unpack('<4sI', header)
+
+        if chunk_id == b'fmt ':
+            fmt = f.read(size + (size & 1))
+            if len(fmt) < 16:
+                return None
+            tag, channels, samplerate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+            if bits != 16 or tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+                print(f"WAV streaming only supports 16-bit PCM, got {bits}-bit (format {tag:#x})")
+                return None
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            return channels, samplerate, block_align, f.tell(), size
+        else:
+            f.seek(size + (size & 1), os.SEEK_CUR)
+
+class WavMemmapSource:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = read_wav_header(f)
+        if not header:
+            raise ValueError(f"{path} is not a 16-bit PCM WAV file")
+        self.channels, self.samplerate, self.block_align, data_offset, data_size = header
+        self.data_offset = data_offset
+
+        # writers that never patch the header leave 0 or 0xFFFFFFFF here
+        file_size = os.path.getsize(path)
+        if data_size in (0, 0xFFFFFFFF) or data_offset + data_size > file_size:
+            data_size = file_size - data_offset
+        self.frames = data_size // self.block_align
+        self.pcm = np.memmap(path, dtype='<i2', mode='r', offset=data_offset,
+                             shape=(self.frames, self.channels)) if self.frames else np.zeros((0, self.channels), dtype='<i2')
+        # full callback blocks are read through the page cache into one buffer, a slice of the map would
+        # cost an array object every block
+        self.raw = open(path, 'rb', buffering=0)
+        self._raw_frame = None
+        self._block = np.zeros((0, self.channels), dtype='<i2')
+        self._block_bytes = None
+        self._block_size = 0
+        self.position = 0
+
+    def seek(self, frame):
+        self.position = max(0, min(frame, self.frames))
+        return self.position
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        block = np.empty((max(0, min(frames, self.frames - self.position)), self.channels), dtype=dtype)
+        self.read_into(block)
+        return block
+
+    def read_into(self, out):
+        pcm = self.pcm
+        if pcm is None:
+            return 0
+        frames = len(out)
+        if frames and self.position + frames <= self.frames and self._read_block(out, frames):
+            self.position += frames
+            self._raw_frame = self.position
+            return frames
+
+        # comparisons rather than min/max, which allocate their argument tuple
+        count = self.frames - self.position
+        if count > frames:
+            count = frames
+        elif count < 0:
+            count = 0
+        # cast in place first, np.multiply on int16 input allocates a conversion buffer
+        out = out[:count]
+        np.copyto(out, pcm[self.position:self.position + count], casting='unsafe')
+        np.multiply(out, PCM16_SCALE, out=out)
+        self.position += count
+        self._raw_frame = None
+        return count
+
+    def _read_block(self, out, frames):
+        block = self._block
+        if len(block) != frames:
+            block = self._block = np.zeros((frames, self.channels), dtype='<i2')
+            self._block_bytes = memoryview(block).cast('B')
+            self._block_size = block.nbytes
+        try:
+            # consecutive blocks follow on in the file, only a seek or a partial read moves it
+            if self._raw_frame != self.position:
+                self.raw.seek(self.data_offset + self.position * self.block_align)
+            if self.raw.readinto(self._block_bytes) != self._block_size:
+                self._raw_frame = None
+                return False
+        except (OSError, ValueError):
+            self._raw_frame = None
+            return False
+        np.copyto(out, block, casting='unsafe')
+        np.multiply(out, PCM16_SCALE, out=out)
+        return True
+
+    def close(self):
+        self.pcm = None
+        self.raw.close()
+
+class WavMemmapStream:
+    def __init__(self, source):
+        self.source = source
+        self.path = source.path
+        self.samplerate = source.samplerate
+        self.total_frames = source.frames
+        self.eof = False
+        self.gain = 1.0
+        self.applied_gain = 1.0
+        self._mono = source.channels == 1
+        self._out = None
+
+    @property
+    def position(self):
+        return self.source.position
+
+    @property
+    def finished(self):
+        return self.source.position >= self.total_frames
+
+    def read_into(self, out):
+        if self._mono:
+            if out is not self._out:
+                self._out = out
+                self._views = out[:, :1], out[:, 0], out[:, 1]
+            first, left, right = self._views
+            count = self.source.read_into(first)
+            if count == len(out):
+                np.copyto(right, left)
+            else:
+                out[:count, 1] = out[:count, 0]
+        else:
+            count = self.source.read_into(out)
+        self.eof = self.finished
+        return count
+
+    def seek(self, frame):
+        self.source.seek(frame)
+        self.eof = self.finished
+
+    def close(self):
+        self.source.close()
+
+def open_track_stream(source, output_rate=None):
+    if isinstance(source, str) and source.lower().endswith('.wav'):
+        try:
+            wav = WavMemmapSource(source)
+        except (OSError, ValueError):
+            wav = None
+        if wav:
+            # int16 straight from the page cache when no resampling or downmix is needed
+            if wav.channels <= 2 and wav.samplerate == int(output_rate or wav.samplerate):
+                return WavMemmapStream(wav)
+            return StreamingDecoder(wav, output_rate=output_rate)
+    if isinstance(source, str) and source.lower().endswith('.mp3'):
+        return StreamingDecoder(IndexedMp3Source(source), output_rate=output_rate)
+    return StreamingDecoder(source, output_rate=output_rate)
+
+class StreamingDecoder:
+    def __init__(self, source, block_frames=BLOCK_FRAMES, buffer_frames=BUFFER_FRAMES, output_rate=None):
+        self.block_frames = block_frames
+        if hasattr(source, 'read'):
+            self.path = getattr(source, 'path', None)
+            self.file = source
+        else:
+            self.path = source
+            self.file = sf.SoundFile(source)
+        self.source_rate = self.file.samplerate
+        self.samplerate = int(output_rate or self.source_rate)
+        self.resampler = None
+        if self.samplerate != self.source_rate:
+            self.resampler = StreamingResampler(self.source_rate, self.samplerate)
+        self.total_frames = self._to_output(self.file.frames)
+        self.ring = RingBuffer(buffer_frames)
+        self.position = 0
+        self.eof = False
+        self.gain = 1.0
+        self.applied_gain = 1.0
+        self._seek_to = None
+        self._stop = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def finished(self):
+        return self.eof and self.ring.available() == 0
+
+    def read_into(self, out):
+        count = self.ring.read_into(out)
+        self.position += count
+        return count
+
+    def seek(self, frame):
+        frame = max(0, min(frame, self.total_frames))
+        if getattr(self.file, 'pending', False):
+            frame = min(frame, self._to_output(self.file.available_frames()))
+        with self.ring.lock:
+            # the decode thread takes the target and its generation together
+            self._seek_to = (frame, self.ring._clear())
+        self.position = frame
+        self.eof = False
+        self._wake.set()
+
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join(timeout=1)
+        self.file.close()
+
+    def _fail(self, error):
+        # ending the track lets the sequencer move on instead of waiting on a dead decoder
+        print(f"Decoding {self.path or 'track'} failed: {error}")
+        self.eof = True
+
+    def _to_output(self, frames):
+        return frames * self.samplerate // self.source_rate
+
+    def _decode_loop(self):
+        pending = None
+        flushed = False
+        generation = self.ring.generation
+
+        while not self._stop:
+            with self.ring.lock:
+                seek, self._seek_to = self._seek_to, None
+            if seek is not None:
+                frame, generation = seek
+                self.eof = False
+                pending = None
+                flushed = False
+                if self.resampler:
+                    self.resampler.reset()
+                try:
+                    self.file.seek(frame * self.source_rate // self.samplerate)
+                except (OSError, RuntimeError, ValueError) as e:
+                    self._fail(e)
+                    continue
+
+            if pending is None and not self.eof:
+                started = time.perf_counter()
+                try:
+                    block = self.file.read(self.block_frames, dtype='float32', always_2d=True)
+                except (OSError, RuntimeError, ValueError) as e:
+                    self._fail(e)
+                    continue
+                if len(block) == 0 and getattr(self.file, 'pending', False):
+                    self._wake.wait(0.05)
+                    self._wake.clear()
+                    continue
+                elif len(block) == 0 and self.resampler and not flushed:
+                    pending = self.resampler.flush()
+                    flushed = True
+                elif len(block) == 0:
+                    self.eof = True
+                else:
+                    pending = downmix(block)
+                    if self.resampler:
+                        pending = self.resampler.process(pending)
+                    DECODE_SECONDS.inc(time.perf_counter() - started)
+                    DECODED_AUDIO_SECONDS.inc(len(block) / self.source_rate)
+
+            if pending is not None:
+                written = self.ring.write(pending, generation)
+                if written < 0:
+                    pending = None
+                    continue
+                pending = pending[written:] if written < len(pending) else None
+
+            if pending is not None or self.eof:
+                self._wake.wait(0.01)
+                self._wake.clear()
+
+class TrackSequencer:
+    def __init__(self, crossfade_frames=0):
+        self.crossfade_frames = crossfade_frames
+        # (decoder, tag) pairs, each replaced in one assignment so the callback never sees a decoder
+        # with another track's tag
+        self.playing = (None, None)
+        self.queued = (None, None)
+        self.advance_count = 0
+        self.short_reads = 0
+        self.reads_started = 0
+        self.reads_done = 0
+        self.retired = []
+        self._incoming = np.zeros((0, 2), dtype=np.float32)
+        self._gain = np.zeros(0, dtype=np.float32)
+        self._track_gain = np.zeros(0, dtype=np.float32)
+        self._ramp = np.zeros(0, dtype=np.float32)
+        self._track_scale = np.ones((), dtype=np.float32)
+        self._fade_remaining = np.zeros((), dtype=np.float32)
+        self._fade_length = np.ones((), dtype=np.float32)
+        self._fade_one = np.ones((), dtype=np.float32)
+        self._fade_zero = np.zeros((), dtype=np.float32)
+        self._fade_frames = 0
+        self._fade_out = None
+
+    @property
+    def current(self):
+        return self.playing[0]
+
+    @property
+    def current_tag(self):
+        return self.playing[1]
+
+    @property
+    def next(self):
+        return self.queued[0]
+
+    @property
+    def next_tag(self):
+        return self.queued[1]
+
+    def set_current(self, decoder, tag=None):
+        self._retire(self.current)
+        self._retire(self.next)
+        self.queued = (None, None)
+        self.playing = (decoder, tag)
+
+    def queue_next(self, decoder, tag=None):
+        self._retire(self.next)
+        self.queued = (decoder, tag)
+
+    def retag(self, remap, queued=True):
+        playing = self.playing
+        self.playing = (playing[0], remap(playing[1]))
+        if queued:
+            upcoming = self.queued
+            self.queued = (upcoming[0], remap(upcoming[1]))
+
+    def collect_retired(self, force=False):
+        # a read that started before a decoder was retired may still be using it
+        done = self.reads_done
+        retired, self.retired = self.retired, []
+        for entry in retired:
+            if not force and entry[1] > done:
+                self.retired.append(entry)
+        return [decoder for decoder, started in retired if force or started <= done]
+
+    def read_into(self, out):
+        self.reads_started += 1
+        try:
+            self._read_into(out)
+        finally:
+            self.reads_done += 1
+
+    def _read_into(self, out):
+        current = self.current
+        upcoming = self.next
+        if current is None:
+            out.fill(0)
+            return
+
+        # frame counts are boxed ints, so the full-block path keeps as few of them alive as it can
+        if upcoming is not None and 0 < self.crossfade_frames and \
+                current.total_frames - current.position <= self.crossfade_frames:
+            self._crossfade_into(out, current, upcoming)
+            count = len(out)
+        else:
+            count = current.read_into(out)
+            self._apply_gain(current, out if count == len(out) else out[:count])
+            if count < len(out) and not current.finished:
+                self.short_reads += 1
+            if count < len(out) and current.finished and upcoming is not None:
+                read = upcoming.read_into(out[count:])
+                self._apply_gain(upcoming, out[count:count + read])
+                count += read
+
+        if current.finished and upcoming is not None:
+            self._advance()
+
+        if count < len(out):
+            out[count:] = 0
+
+    def _crossfade_into(self, out, current, upcoming):
+        if len(out) != self._fade_frames or out is not self._fade_out:
+            self._make_fade_views(out)
+        # 0-d operands and one channel at a time: scalars, np.clip and broadcasts allocate every block
+        self._fade_remaining[()] = current.total_frames - current.position
+        self._fade_length[()] = self.crossfade_frames
+
+        count = current.read_into(out)
+        self._apply_gain(current, out if count == len(out) else out[:count])
+        if count < len(out):
+            out[count:] = 0
+        incoming = self._fade_incoming
+        count = upcoming.read_into(incoming)
+        self._apply_gain(upcoming, incoming if count == len(out) else incoming[:count])
+        if count < len(out):
+            incoming[count:] = 0
+
+        gain = self._fade_gain
+        np.subtract(self._fade_remaining, self._fade_ramp, out=gain)
+        np.divide(gain, self._fade_length, out=gain)
+        np.minimum(gain, self._fade_one, out=gain)
+        np.maximum(gain, self._fade_zero, out=gain)
+        left, right = self._fade_out_channels
+        np.multiply(left, gain, out=left)
+        np.multiply(right, gain, out=right)
+        np.subtract(self._fade_one, gain, out=gain)
+        left, right = self._fade_incoming_channels
+        np.multiply(left, gain, out=left)
+        np.multiply(right, gain, out=right)
+        np.add(out, incoming, out=out)
+
+    def _make_fade_views(self, out):
+        frames = len(out)
+        self._ensure_scratch(frames)
+        self._fade_frames = frames
+        self._fade_out = out
+        self._fade_out_channels = out[:, 0], out[:, 1]
+        self._fade_incoming = self._incoming[:frames]
+        self._fade_incoming_channels = self._fade_incoming[:, 0], self._fade_incoming[:, 1]
+        self._fade_gain = self._gain[:frames]
+        self._fade_ramp = self._ramp[:frames]
+
+    def _apply_gain(self, decoder, block):
+        target = decoder.gain
+        if target == decoder.applied_gain:
+            if target != 1.0:
+                self._track_scale[()] = target
+                np.multiply(block, self._track_scale, out=block)
+            return
+
+        # a new track gain fades in over one block instead of stepping
+        frames = len(block)
+        self._ensure_scratch(frames)
+        gain = self._track_gain[:frames]
+        np.multiply(self._ramp[:frames], (target - decoder.applied_gain) / max(frames, 1), out=gain)
+        gain += decoder.applied_gain
+        # per channel, a broadcast multiply allocates an iterator buffer
+        for channel in range(block.shape[1]):
+            block[:, channel] *= gain
+        decoder.applied_gain = target
+
+    def _ensure_scratch(self, frames):
+        if len(self._gain) < frames:
+            self._incoming = np.zeros((frames, 2), dtype=np.float32)
+            self._gain = np.zeros(frames, dtype=np.float32)
+            self._track_gain = np.zeros(frames, dtype=np.float32)
+            self._ramp = np.arange(frames, dtype=np.float32)
+
+    def _advance(self):
+        self._retire(self.current)
+        self.playing = self.queued
+        self.queued = (None, None)
+        self.advance_count += 1
+
+    def _retire(self, decoder):
+        if decoder is not None:
+            self.retired.append((decoder, self.reads_started))
+
+class PlaybackMixer:
+    def __init__(self, sequencer, max_frames=BLOCK_FRAMES, volume=1.0, samplerate=44100, limiter=False):
+        self.sequencer = sequencer
+        self._volume = np.array(volume, dtype=np.float32)
+        self.limiter = limiter
+        self._limiting = False
+        self.ceiling = np.array(LIMITER_CEILING, dtype=np.float32)
+        self._floor = np.array(-LIMITER_CEILING, dtype=np.float32)
+        self.lookahead = max(1, int(LIMITER_LOOKAHEAD_SECONDS * samplerate))
+        self.release = float(np.exp(-1 / (LIMITER_RELEASE_SECONDS * samplerate)))
+        self.reduction = 0.0
+        self._box_scale = np.array(1 / (self.lookahead + 1), dtype=np.float32)
+        self._half = np.array(0.5, dtype=np.float32)
+        self._one = np.ones((), dtype=np.float32)
+        self._capacity = 0
+        self._frames = 0
+        self._allocate(max_frames)
+
+    @property
+    def volume(self):
+        return float(self._volume)
+
+    @volume.setter
+    def volume(self, volume):
+        self._volume[()] = volume
+
+    def render(self, outdata, frames):
+        if frames != self._frames:
+            self._allocate(frames)
+
+        self.sequencer.read_into(self._mix_block)
+        np.add(self._mix_left, self._mix_right, out=self._mono_block)
+        np.multiply(self._mono_block, self._half, out=self._mono_block)
+        if self.limiter:
+            if not self._limiting:
+                # the delay line still holds whatever played when the limiter was last on
+                self._reset_limiter()
+            self._limit(outdata)
+        else:
+            np.multiply(self._mix_block, self._volume, out=outdata)
+        self._limiting = self.limiter
+        return self._mono_block
+
+    def _reset_limiter(self):
+        self._delayed[:self.lookahead] = 0
+        self._held[:self.lookahead] = 0
+        self.reduction = 0.0
+
+    def _limit(self, outdata):
+        # every view used here is made in _allocate; slicing, reductions and scans would each allocate
+        # per block, so maxima, sums and the release scan are doubling passes of elementwise ufuncs
+        views = self._views
+        # the output runs `lookahead` frames behind, so each frame can see the peaks coming up
+        np.multiply(self._mix_block, self._volume, out=views['delayed_in'])
+
+        depth = views['depth']
+        np.abs(views['delayed_left'], out=depth)
+        np.abs(views['delayed_right'], out=views['scratch'])
+        np.maximum(depth, views['scratch'], out=depth)
+
+        if np.count_nonzero(np.greater(depth, self.ceiling, out=views['over'])) == 0 and self.reduction < 1e-6:
+            self.reduction = 0.0
+            views['held_head'].fill(0)
+            np.copyto(outdata, views['delayed_out'])
+        else:
+            # gain reduction each frame needs
+            np.maximum(depth, self.ceiling, out=depth)
+            np.divide(self.ceiling, depth, out=depth)
+            np.subtract(self._one, depth, out=depth)
+
+            # hold the largest reduction of the next lookahead + 1 frames (max over doubling spans)
+            for first, second, target in views['hold_steps']:
+                np.maximum(first, second, out=target)
+
+            # averaging the held values over the previous lookahead + 1 frames ramps the reduction in
+            # and still reaches the full amount at the peak; the window sum is built from doubling spans
+            reduction = views['reduction']
+            reduction.fill(0)
+            for kind, first, second, target in views['box_steps']:
+                if kind:
+                    np.add(reduction, first, out=reduction)
+                else:
+                    np.add(first, second, out=target)
+            np.multiply(reduction, self._box_scale, out=reduction)
+
+            # exponential release: r[n] = max(a[n], k r[n-1]) is the running max of a[n] / k^n, scaled
+            # back by k^n; the running max is a doubling scan between two buffers
+            carried = self.reduction * self.release
+            if carried > reduction.item(0):
+                reduction[0] = carried
+            np.multiply(reduction, views['release_inverse'], out=reduction)
+            for source, shifted, target, head, head_target in views['release_steps']:
+                np.maximum(source, shifted, out=target)
+                np.copyto(head_target, head)
+            np.multiply(views['release_result'], views['release_powers'], out=reduction)
+            self.reduction = reduction.item(-1)
+
+            np.subtract(self._one, reduction, out=reduction)
+            np.multiply(views['delayed_out_left'], reduction, out=views['limited_left'])
+            np.multiply(views['delayed_out_right'], reduction, out=views['limited_right'])
+            np.minimum(views['limited'], self.ceiling, out=views['limited'])
+            np.maximum(views['limited'], self._floor, out=views['limited'])
+            np.copyto(outdata, views['limited'])
+            np.copyto(views['held_head'], views['held_tail'])
+        np.copyto(views['delayed_head'], views['delayed_tail'])
+
+    def _allocate(self, frames):
+        lookahead = self.lookahead
+        if frames > self._capacity:
+            delayed = getattr(self, '_delayed', None)
+            held = getattr(self, '_held', None)
+            self._capacity = frames
+            self._mix = np.zeros((frames, 2), dtype=np.float32)
+            self._mono = np.zeros(frames, dtype=np.float32)
+            self._delayed = np.zeros((frames + lookahead, 2), dtype=np.float32)
+            if delayed is not None:
+                self._delayed[:lookahead] = delayed[:lookahead]
+            self._peak = np.zeros(frames + lookahead, dtype=np.float32)
+            self._scratch = np.zeros(frames + lookahead, dtype=np.float32)
+            self._held = np.zeros(frames + lookahead, dtype=np.float32)
+            if held is not None:
+                self._held[:lookahead] = held[:lookahead]
+            self._over = np.zeros(frames + lookahead, dtype=bool)
+            self._sums = np.zeros((2, frames + lookahead), dtype=np.float32)
+            self._reduction = np.zeros((2, frames), dtype=np.float32)
+            self._limited = np.zeros((frames, 2), dtype=np.float32)
+        self._frames = frames
+        span = frames + lookahead
+
+        self._mix_block = self._mix[:frames]
+        self._mix_left = self._mix_block[:, 0]
+        self._mix_right = self._mix_block[:, 1]
+        self._mono_block = self._mono[:frames]
+
+        delayed = self._delayed[:span]
+        views = {
+            'delayed_in': delayed[lookahead:],
+            'delayed_left': delayed[:, 0],
+            'delayed_right': delayed[:, 1],
+            'delayed_out': delayed[:frames],
+            'delayed_out_left': delayed[:frames, 0],
+            'delayed_out_right': delayed[:frames, 1],
+            'delayed_head': delayed[:lookahead],
+            'delayed_tail': delayed[frames:frames + lookahead],
+            'depth': self._peak[:span],
+            'scratch': self._scratch[:span],
+            'over': self._over[:span],
+            'held_head': self._held[:lookahead],
+            'held_tail': self._held[frames:frames + lookahead],
+            'reduction': self._reduction[0, :frames],
+            'limited': self._limited[:frames],
+            'limited_left': self._limited[:frames, 0],
+            'limited_right': self._limited[:frames, 1],
+        }
+
+        hold_steps = []
+        source, target = self._peak, self._scratch
+        width = 1
+        while width * 2 <= lookahead + 1:
+            hold_steps.append((source[:span - width], source[width:span], target[:span - width]))
+            source, target = target, source
+            span -= width
+            width *= 2
+        shift = lookahead + 1 - width
+        hold_steps.append((source[:frames], source[shift:shift + frames], self._held[lookahead:lookahead + frames]))
+        views['hold_steps'] = hold_steps
+
+        # sum of held[n:n + lookahead + 1]: add the 2^k spans for the set bits of the window length
+        box_steps = []
+        window = lookahead + 1
+        level = self._held
+        span = frames + lookahead
+        offset = 0
+        width = 1
+        while True:
+            if window & width:
+                box_steps.append((True, level[offset:offset + frames], None, None))
+                offset += width
+            if width * 2 > window:
+                break
+            following = self._sums[1] if level is self._sums[0] else self._sums[0]
+            box_steps.append((False, level[:span - width], level[width:span], following[:span - width]))
+            level = following
+            span -= width
+            width *= 2
+        views['box_steps'] = box_steps
+
+        release_steps = []
+        source, target = self._reduction[0, :frames], self._reduction[1, :frames]
+        width = 1
+        while width < frames:
+            release_steps.append((source[width:], source[:frames - width], target[width:], source[:width],
+                                  target[:width]))
+            source, target = target, source
+            width *= 2
+        views['release_steps'] = release_steps
+        views['release_result'] = source
+        powers = self.release ** np.arange(frames)
+        views['release_powers'] = powers.astype(np.float32)
+        views['release_inverse'] = (1 / powers).astype(np.float32)
+        self._views = views
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import soundfile as sf
+from audio_stream import BLOCK_FRAMES
+from playback_engine import PlaybackEngine, NullOutput
+from resampler import StreamingResampler, downmix
+from spectrum import SpectrumEngine
+
+SAMPLE_RATE = 44100
+CHUNK_SIZE = 1024
+DISPLAY_INTERVAL = 1 / 60
+NUM_BARS = 20
+# enough boost that the limiter is reducing gain on nearly every block
+LIMITER_TEST_GAIN_DB = 12.0
+WARMUP_BLOCKS = 8
+PERCENTILES = [50, 90, 99, 99.9]
+RESAMPLER_CASES = [(44100, 48000, 2), (48000, 44100, 2), (96000, 48000, 2), (96000, 44100, 6)]
+SPECTRUM_STREAMS = [1, 2, 8]
+SYNTHETIC_CASES = [("wav", 44100), ("flac", 44100), ("wav", 48000)]
+
+def make_test_file(path, seconds, sample_rate=SAMPLE_RATE):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t)
+    noise = 0.05 * np.random.default_rng(0).standard_normal((len(t), 2))
+    sf.write(path, tone[:, None] + noise, sample_rate, subtype='PCM_16')
+    return path
+
+def make_visualizer(sample_rate, num_bars=NUM_BARS):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+    from visualizer import AudioVisualizer
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    visualizer = AudioVisualizer(num_bars=num_bars, smoothing=0.7, sample_rate=sample_rate,
+                                 frame_rate=1 / DISPLAY_INTERVAL)
+    visualizer.timer.stop()
+    visualizer.win.resize(800, 300)
+    visualizer.win.show()
+    return app, visualizer
+
+def wait_for_decoder(sequencer, frames, settle=False, timeout=1.0):
+    decoder = sequencer.current
+    ring = getattr(decoder, 'ring', None)
+    if ring is None:
+        return
+    # tracemalloc sees every thread, so let the decoder fill up and go idle before a traced block
+    if settle:
+        ready = lambda: ring.space() < decoder.block_frames
+    else:
+        ready = lambda: ring.available() >= frames
+    deadline = time.monotonic() + timeout
+    while not ready() and not decoder.eof and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+def other_thread_clocks():
+    # tracemalloc counts every thread, so a block during which the decoder or control thread ran can't
+    # be blamed on the callback; their CPU clocks tell which blocks those were
+    if not hasattr(time, 'pthread_getcpuclockid'):
+        return []
+    clocks = []
+    for thread in threading.enumerate():
+        if thread.ident != threading.get_ident():
+            try:
+                clocks.append(time.pthread_getcpuclockid(thread.ident))
+            except OSError:
+                pass
+    return clocks
+
+def cpu_times(clocks):
+    times = []
+    for clock in clocks:
+        try:
+            times.append(time.clock_gettime_ns(clock))
+        except OSError:
+            times.append(None)
+    return times
+
+def run_pipeline(path, blocks, chunk_size=CHUNK_SIZE, output_rate=SAMPLE_RATE, visualizer=None, trace=False,
+                 limiter=False):
+    playlist = [{'path': path}]
+    engine = PlaybackEngine(lambda index, foreground: playlist[index]['path'], playlist,
+                            NullOutput(output_rate, chunk_size, speed=0), normalize=limiter,
+                            get_gain=lambda index: LIMITER_TEST_GAIN_DB)
+    engine.set_volume(0.5)
+    if visualizer:
+        visualizer.reset()
+        engine.on_block = visualizer.process_audio
+    engine.load(0)
+
+    outdata = np.zeros((chunk_size, 2), dtype=np.float32)
+    block_seconds = chunk_size / output_rate
+    callback = np.zeros(blocks)
+    display = np.zeros(int(blocks * block_seconds / DISPLAY_INTERVAL) + 1)
+    allocated = np.zeros(blocks, dtype=np.int64)
+    # blocks left out: the first few, which size the buffers for the callback's block size and fill
+    # numpy's own dispatch caches, and any during which another thread ran
+    measured = np.zeros(blocks, dtype=bool)
+    next_frame = 0.0
+    frames = 0
+
+    for i in range(blocks):
+        wait_for_decoder(engine.sequencer, chunk_size, settle=trace)
+        if trace:
+            clocks = other_thread_clocks()
+            busy = cpu_times(clocks)
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        engine.render(outdata, chunk_size)
+        callback[i] = time.perf_counter() - start
+
+        if trace:
+            allocated[i] = tracemalloc.get_traced_memory()[1] - before
+            measured[i] = i >= WARMUP_BLOCKS and cpu_times(clocks) == busy
+        # the display timer runs on its own clock: draw every frame that came due while this block played,
+        # which is more than one per block when blocks are longer than a frame
+        while visualizer and next_frame <= (i + 1) * block_seconds and frames < len(display):
+            start = time.perf_counter()
+            visualizer._update_display()
+            visualizer.win.repaint()
+            display[frames] = time.perf_counter() - start
+            frames += 1
+            next_frame += DISPLAY_INTERVAL
+
+    engine.close()
+    return callback, display[:frames] if visualizer else None, allocated[measured]
+
+def summarize(timings, budget):
+    micros = timings * 1e6
+    summary = {
+        'count': len(timings),
+        'budget_us': budget * 1e6,
+        'mean_us': float(micros.mean()),
+        'max_us': float(micros.max()),
+        'deadline_misses': int(np.count_nonzero(timings > budget)),
+    }
+    for p in PERCENTILES:
+        summary[f'p{p:g}_us'] = float(np.percentile(micros, p))
+    return summary
+
+def max_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def array_header_bytes():
+    # the least any view, temporary or reduction result costs; frame counters past 256 are boxed ints and
+    # churn a few smaller blocks every callback, which no Python code can avoid
+    data = np.zeros(1, dtype=np.float32)
+    sizes = []
+    for _ in range(8):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        view = data[:]
+        sizes.append(tracemalloc.get_traced_memory()[1] - before)
+    return min(sizes)
+
+def benchmark_case(name, path, args, visualizer=None):
+    budget = args.chunk_size / args.rate
+    callback, display, _ = run_pipeline(path, args.blocks, args.chunk_size, args.rate, visualizer, limiter=args.limiter)
+
+    tracemalloc.start()
+    header = array_header_bytes()
+    _, _, allocated = run_pipeline(path, args.alloc_blocks, args.chunk_size, args.rate, visualizer, trace=True,
+                                   limiter=args.limiter)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {
+        'name': name,
+        'path': path,
+        'callback': summarize(callback, budget),
+        'allocations': {
+            'blocks': len(allocated),
+            'blocks_skipped': args.alloc_blocks - len(allocated),
+            'blocks_allocating': int(np.count_nonzero(allocated >= header)),
+            'array_header_bytes': header,
+            'mean_bytes': float(allocated.mean()) if len(allocated) else 0.0,
+            'max_bytes': int(allocated.max(initial=0)),
+        },
+        'traced_peak_bytes': traced_peak,
+    }
+    if display is not None:
+        result['visualizer_frame'] = summarize(display, DISPLAY_INTERVAL)
+    return result
+
+def benchmark_resampler(input_rate, output_rate, channels=2, seconds=30, block_frames=BLOCK_FRAMES):
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, (int(seconds * input_rate), channels)).astype(np.float32)
+    resampler = StreamingResampler(input_rate, output_rate)
+
+    start = time.process_time()
+    for i in range(0, len(audio), block_frames):
+        resampler.process(downmix(audio[i:i + block_frames]))
+    resampler.flush()
+    cpu_seconds = time.process_time() - start
+    return seconds / cpu_seconds
+
+def benchmark_spectrum(num_streams, batched=True, repeats=2000):
+    engines = [SpectrumEngine(num_streams)] if batched else [SpectrumEngine(1) for _ in range(num_streams)]
+    for engine in engines:
+        engine.frames[:] = np.random.default_rng(0).uniform(-0.5, 0.5, engine.frames.shape)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for engine in engines:
+            engine.analyze()
+    return (time.perf_counter() - start) / repeats
+
+def print_summary(name, summary):
+    print(f"{name}: {summary['count']} runs (budget {summary['budget_us'] / 1000:.1f} ms)")
+    percentiles = ", ".join(f"p{p:g} {summary[f'p{p:g}_us']:.1f} us" for p in PERCENTILES)
+    print(f"  mean {summary['mean_us']:.1f} us, {percentiles}, max {summary['max_us']:.1f} us")
+    print(f"  worst block uses {summary['max_us'] / summary['budget_us'] * 100:.2f}% of the budget, "
+          f"{summary['deadline_misses']} deadline misses")
+
+def print_case(result):
+    print(f"== {result['name']}")
+    print_summary("audio callback", result['callback'])
+    if 'visualizer_frame' in result:
+        print_summary("visualizer frame", result['visualizer_frame'])
+    alloc = result['allocations']
+    print(f"allocations: {alloc['blocks_allocating']}/{alloc['blocks']} blocks allocate an array "
+          f"({alloc['array_header_bytes']} B or more), mean {alloc['mean_bytes']:.0f} B, max {alloc['max_bytes']} B per block "
+          f"({alloc['blocks_skipped']} left out)")
+    print(f"traced heap peak {result['traced_peak_bytes'] / 1024:.0f} KiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the playback and visualizer path offline and time it per block")
+    parser.add_argument("files", nargs="*", help="audio files to play (default: synthetic 60 s tones)")
+    parser.add_argument("--blocks", type=int, default=2000)
+    parser.add_argument("--alloc-blocks", type=int, default=200, help="blocks to run under tracemalloc")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rate", type=int, default=SAMPLE_RATE, help="output device rate to simulate")
+    parser.add_argument("--no-visualizer", action="store_true", help="skip the Qt visualizer")
+    parser.add_argument("--limiter", action="store_true",
+                        help=f"normalize with +{LIMITER_TEST_GAIN_DB:g} dB and run the look-ahead limiter on every block")
+    parser.add_argument("--bars", type=int, default=NUM_BARS, help="visualizer bar count")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--resampler", action="store_true", help="report resampler throughput instead")
+    parser.add_argument("--spectrum", action="store_true", help="report live-input FFT cost per stream count instead")
+    args = parser.parse_args()
+
+    if args.resampler:
+        for input_rate, output_rate, channels in RESAMPLER_CASES:
+            speed = benchmark_resampler(input_rate, output_rate, channels)
+            print(f"resample {input_rate} -> {output_rate} Hz, {channels} ch: {speed:.0f} s of audio per CPU second")
+        raise SystemExit
+
+    if args.spectrum:
+        for streams in SPECTRUM_STREAMS:
+            batched = benchmark_spectrum(streams)
+            separate = benchmark_spectrum(streams, batched=False)
+            print(f"spectrum {streams} streams: {batched * 1e6:.1f} us batched, {separate * 1e6:.1f} us one at a time")
+        raise SystemExit
+
+    cases = [(os.path.basename(path), path) for path in args.files]
+    if not cases:
+        for ext, rate in SYNTHETIC_CASES:
+            path = os.path.join(tempfile.gettempdir(), f"benchmark_tone_{rate}.{ext}")
+            cases.append((f"synthetic {ext} {rate} Hz", make_test_file(path, 60, rate)))
+
+    visualizer = None
+    if not args.no_visualizer:
+        app, visualizer = make_visualizer(args.rate, args.bars)
+
+    results = [benchmark_case(name, path, args, visualizer) for name, path in cases]
+    report = {
+        'chunk_size': args.chunk_size,
+        'output_rate': args.rate,
+        'limiter': args.limiter,
+        'cases': results,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+        for result in results:
+            print_case(result)
+        if report['max_rss_bytes']:
+            print(f"process memory high-water mark {report['max_rss_bytes'] / 2 ** 20:.1f} MiB")
+
+    allocating = [result['name'] for result in results
+                  if result['allocations']['blocks_allocating'] or not result['allocations']['blocks']]
+    if allocating:
+        sys.exit(f"the audio callback allocates arrays (or no block could be measured) in: {', '.join(allocating)}")
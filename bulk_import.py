@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import soundfile as sf
+from cd_backends import FRAMES_PER_SECTOR
+from rip_cache import encode_flac, file_sha256
+from cd_audio_source import RIP_SECONDS, RIPPED_AUDIO_SECONDS, RIP_REALTIME
+
+SECTORS_PER_SECOND = 75
+
+def encode_track(wav_path, flac_path=None):
+    # runs in a worker process: the bit-exact FLAC check and the cache checksum both read the file there
+    if flac_path is None:
+        return file_sha256(wav_path)
+    encode_flac(wav_path, flac_path)
+    return file_sha256(flac_path)
+
+def format_duration(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+class BulkImporter:
+    def __init__(self, cd_source, workers=None, library=None):
+        self.cd_source = cd_source
+        self.cache = cd_source.cache
+        self.workers = workers or os.cpu_count() or 1
+        self.library = library
+        self.pool = None
+        self.lock = threading.Lock()
+        self.total_tracks = 0
+        self.imported = 0
+        self.skipped = 0
+        self.failed = []
+        self.audio_seconds = 0.0
+        self.started = None
+
+    def run(self, track_numbers=None):
+        disc = self.cd_source.disc
+        tracks = self.cd_source.get_track_info()
+        track_numbers = track_numbers or [track['number'] for track in tracks]
+        self.total_tracks = len(track_numbers)
+        self.started = time.monotonic()
+        print(f"Importing {self.total_tracks} tracks of {self.cd_source.get_disc_info_string()} ({disc.id})")
+
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            for track_number in track_numbers:
+                self._import_track(track_number)
+        except KeyboardInterrupt:
+            print("Import interrupted, run it again to resume")
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        # the drive is done; wait for the last encodes
+        self.pool.shutdown(wait=True)
+
+        if self.library:
+            self.library.add_disc(disc.id, self.cd_source.disc_info, tracks)
+        elapsed = time.monotonic() - self.started
+        print(f"Imported {self.imported - self.skipped} tracks ({format_duration(self.audio_seconds)} of audio) "
+              f"in {format_duration(elapsed)}, {self.audio_seconds / max(elapsed, 1e-9):.1f}x real time, "
+              f"{self.skipped} already in the cache")
+        if self.failed:
+            print(f"Failed tracks: {', '.join(str(track_number) for track_number in self.failed)}")
+        return not self.failed
+
+    def _import_track(self, track_number):
+        disc_id = self.cd_source.disc.id
+        sectors = self.cd_source.disc.tracks[track_number - 1].length
+        seconds = sectors / SECTORS_PER_SECOND
+
+        cached = self.cache.get(disc_id, track_number)
+        if cached and (cached.endswith(".flac") or not self.cache.compress):
+            self.skipped += 1
+            self._finished(track_number, 0, "already in the cache")
+            return
+        if cached:
+            # ripped during playback but not compressed yet
+            self._submit(track_number, cached, seconds, committed=True)
+            return
+
+        wav_path = self.cache.partial_path(disc_id, track_number)
+        if self._complete_partial(wav_path, sectors):
+            print(f"Track {track_number} was read before the interruption, encoding it")
+        else:
+            started = time.monotonic()
+            try:
+                sf.write(wav_path, self.cd_source.read_track(track_number), 44100, subtype='PCM_16')
+            except (OSError, RuntimeError) as e:
+                # a scratched track or a full disk should not cost the rest of the disc
+                print(f"Reading track {track_number} failed: {e}")
+                with self.lock:
+                    self.failed.append(track_number)
+                if os.path.exists(wav_path):
+                    os.remove(wav_path)
+                return
+            elapsed = time.monotonic() - started
+            RIP_SECONDS.inc(elapsed)
+            RIPPED_AUDIO_SECONDS.inc(seconds)
+            if elapsed > 0:
+                RIP_REALTIME.set(seconds / elapsed)
+            print(f"Read track {track_number} ({format_duration(seconds)}) at {seconds / max(elapsed, 1e-9):.1f}x real time")
+        self._submit(track_number, wav_path, seconds)
+
+    def _complete_partial(self, wav_path, sectors):
+        try:
+            return sf.info(wav_path).frames == sectors * FRAMES_PER_SECTOR
+        except (RuntimeError, OSError):
+            return False
+
+    def _submit(self, track_number, wav_path, seconds, committed=False):
+        disc_id = self.cd_source.disc.id
+        flac_path = self.cache.partial_path(disc_id, track_number, "flac") if self.cache.compress else None
+        future = self.pool.submit(encode_track, wav_path, flac_path)
+
+        def encoded(done):
+            if done.cancelled():
+                return
+            try:
+                checksum = done.result()
+            except Exception as e:
+                print(f"Encoding track {track_number} failed: {e}")
+                with self.lock:
+                    self.failed.append(track_number)
+                return
+            if flac_path:
+                self.cache.commit(disc_id, track_number, flac_path, "flac", checksum)
+                if not committed:
+                    os.remove(wav_path)
+            else:
+                self.cache.commit(disc_id, track_number, wav_path, "wav", checksum)
+            self._finished(track_number, seconds, "encoded" if flac_path else "checksummed")
+
+        future.add_done_callback(encoded)
+
+    def _finished(self, track_number, seconds, status):
+        with self.lock:
+            self.imported += 1
+            self.audio_seconds += seconds
+            elapsed = time.monotonic() - self.started
+            print(f"[{self.imported}/{self.total_tracks}] track {track_number} {status}, "
+                  f"{format_duration(self.audio_seconds)} done, {self.audio_seconds / max(elapsed, 1e-9):.1f}x real time")
+
+if __name__ == "__main__":
+    from cd_audio_source import CDAudioSource
+    from cd_backends import default_backend, ImageFileBackend, LinuxCDDABackend
+    from rip_cache import RipCache
+    from metadata_cache import MetadataCache
+    from library import Library
+
+    parser = argparse.ArgumentParser(description="Rip every track of the disc in the drive into the rip cache")
+    parser.add_argument("--image", help="import a .bin/.cue image instead of the drive")
+    parser.add_argument("--device", help="CD device to read from (Linux)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="encoder processes")
+    parser.add_argument("--tracks", type=int, nargs="*", help="only these track numbers")
+    args = parser.parse_args()
+
+    if args.image:
+        backend = ImageFileBackend(args.image)
+    elif args.device:
+        backend = LinuxCDDABackend(args.device)
+    else:
+        backend = default_backend()
+    if backend is None:
+        sys.exit("Bulk import reads sectors directly and needs --image or a Linux drive")
+
+    cd_source = CDAudioSource(backend, RipCache(), MetadataCache(), os.environ.get("MUSICBRAINZ_HOST"))
+    if not cd_source.detect_cd():
+        sys.exit("No CD detected")
+
+    importer = BulkImporter(cd_source, args.workers, Library())
+    try:
+        ok = importer.run(args.tracks)
+    except KeyboardInterrupt:
+        sys.exit(1)
+    finally:
+        backend.close()
+    sys.exit(0 if ok else 1)
@@ -7,25 +7,47 @@ import subprocess
 import tempfile
 import os
 import struct
+import threading
 import time
+import soundfile as sf
+from cd_backends import SectorSource, PREGAP_SECTORS
+from metadata_cache import find_medium
+from metrics import REGISTRY
 
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
 
+RIP_SECONDS = REGISTRY.counter("rip_seconds_total", "Wall time spent ripping tracks")
+RIPPED_AUDIO_SECONDS = REGISTRY.counter("ripped_audio_seconds_total", "Audio ripped, in seconds of playback")
+RIP_REALTIME = REGISTRY.gauge("rip_realtime_factor", "Speed of the last finished rip, in multiples of real time")
+
 musicbrainzngs.set_useragent("CD Audio Source", "1.0", "https://github.com/JacobKirch18/3xp3dition-audio")
 
 class CDAudioSource:
-    def __init__(self):
+    def __init__(self, backend=None, cache=None, metadata_cache=None, musicbrainz_host=None):
+        self.backend = backend
+        self.cache = cache
+        self.metadata_cache = metadata_cache
         self.disc = None
         self.tracks = []
         self.disc_info = None
         self.temp_dir = tempfile.gettempdir()
         self.ripped_files = []
         self.current_process = None
+        self.ripping_track = None
+        self.rip_cancelled = False
+        self.rip_lock = threading.Lock()
+        self.ripper_command = ["freaccmd.exe"]
+
+        if musicbrainz_host:
+            musicbrainzngs.set_hostname(musicbrainz_host, use_https=False)
 
     def detect_cd(self):
         try:
-            self.disc = discid.read()
+            if self.backend:
+                self.disc = self.backend.read_disc()
+            else:
+                self.disc = discid.read()
             print(f"Detected CD: {self.disc}")
             return True
         except discid.DiscError as e:
@@ -36,57 +58,102 @@ class CDAudioSource:
         if not self.disc:
             print("No CD detected")
             return []
+
+        release = self.lookup_disc()
+        if release is None:
+            return self._get_generic_tracks()
+        return self._parse_release(release)
+
+    def get_track_info_async(self, callback):
+        if not self.disc:
+            print("No CD detected")
+            return []
+
+        release = self._get_cached_release()
+        if release is not None:
+            return self._parse_release(release)
+
+        def lookup_worker():
+            release = self.lookup_disc()
+            if release is not None:
+                callback(self._parse_release(release))
+
+        threading.Thread(target=lookup_worker, daemon=True).start()
+        return self._get_generic_tracks()
+
+    def lookup_disc(self):
+        release = self._get_cached_release()
+        if release is not None:
+            return release
+
         try:
-            time.sleep(1)
             result = musicbrainzngs.get_releases_by_discid(
                 self.disc.id,
                 includes=['artists', 'recordings']
             )
+        except Exception as e:
+            print(f"Error querying MusicBrainz: {e}")
+            return None
+
+        if not result.get('disc'):
+            print("CD not found in MusicBrainz database")
+            return None
+        release = result['disc']['release-list'][0]
+
+        if any('disc-list' not in medium for medium in release['medium-list']):
+            try:
+                release = musicbrainzngs.get_release_by_id(
+                    release['id'],
+                    includes=['artists', 'recordings', 'discids']
+                )['release']
+            except Exception as e:
+                print(f"Error fetching full release from MusicBrainz: {e}")
 
-            if result.get('disc'):
-                release = result['disc']['release-list'][0]
+        self._cache_release(release)
+        return release
 
-                disc_info = result['disc']
-                medium_index = 0
+    def _get_cached_release(self):
+        if not self.metadata_cache:
+            return None
+        return self.metadata_cache.cached_release(self.disc.id)
 
-                if 'offset-list'in disc_info:
-                    for i, medium in enumerate(release['medium-list']):
-                        if 'disc-list' in medium:
-                            for disc in medium['disc-list']:
-                                if disc['id'] == self.disc.id:
-                                    medium_index = i
-                                    break
+    def _cache_release(self, release):
+        if not self.metadata_cache:
+            return
+        release_id = release['id']
+        self.metadata_cache.put(f"release-{release_id}", release)
+        self.metadata_cache.put(self.disc.id, {'release-id': release_id})
+        for medium in release['medium-list']:
+            for disc in medium.get('disc-list', []):
+                self.metadata_cache.put(disc['id'], {'release-id': release_id})
 
-                if medium_index < len(release['medium-list']):
-                    medium = release['medium-list'][medium_index]
-                else:
-                    medium = release['medium-list'][0]
+    def _parse_release(self, release):
+        try:
+            medium = find_medium(release, self.disc.id, len(self.disc.tracks))
+            track_list = medium['track-list']
 
-                track_list = medium['track-list']
+            self.disc_info = {
+                'artist': release['artist-credit-phrase'],
+                'album': release['title'],
+            }
+            if len(release['medium-list']) > 1:
+                self.disc_info['disc_number'] = medium.get('position', '')
 
-                self.disc_info = {
-                    'artist': release['artist-credit-phrase'],
-                    'album': release['title'],
+            self.tracks = []
+            for i, track_data in enumerate(track_list[:len(self.disc.tracks)]):
+                track = {
+                    'number': i + 1,
+                    'title': track_data['recording']['title'],
+                    'length': self.disc.tracks[i].length // 75,
+                    'offset': self.disc.tracks[i].offset,
+                    'frames': self.disc.tracks[i].length * 588
                 }
+                self.tracks.append(track)
 
-                self.tracks = []
-                for i, track_data in enumerate(track_list):
-                    track = {
-                        'number': i + 1,
-                        'title': track_data['recording']['title'],
-                        'length': self.disc.tracks[i].length // 75,
-                        'offset': self.disc.tracks[i].offset
-                    }
-                    self.tracks.append(track)
-
-                return self.tracks
-            
-            else:
-                print("CD not found in MusicBrainz database")
-                return self._get_generic_tracks()
+            return self.tracks
         
         except Exception as e:
-            print(f"Error querying MusicBrainz: {e}")
+            print(f"Error reading MusicBrainz result: {e}")
             return self._get_generic_tracks()
     
     def _get_generic_tracks(self):
@@ -96,7 +163,8 @@ class CDAudioSource:
                 'number': track.number,
                 'title': f"Track {track.number}",
                 'length': track.length // 75,
-                'offset': track.offset
+                'offset': track.offset,
+                'frames': track.length * 588
             })
         return self.tracks
     
@@ -123,12 +191,49 @@ class CDAudioSource:
             bitmask >>= 1
         return None
 
+    def open_track(self, track_number):
+        track = self.disc.tracks[track_number - 1]
+        return SectorSource(self.backend, track.offset, track.length)
+
+    def read_track(self, track_number):
+        track = self.disc.tracks[track_number - 1]
+        return self.backend.read_sectors(track.offset - PREGAP_SECTORS, track.length)
+
+    def get_cached_track(self, track_number):
+        if self.cache and self.disc:
+            return self.cache.get(self.disc.id, track_number)
+        return None
+
+    def get_output_path(self, track_number):
+        if self.cache:
+            return self.cache.partial_path(self.disc.id, track_number)
+        return os.path.join(self.temp_dir, f"{self.disc.id}_track_{track_number:02d}.wav")
+
     def rip_track_to_wav(self, track_number):
+        with self.rip_lock:
+            self.ripping_track = track_number
+            self.rip_cancelled = False
+        try:
+            return self._rip_track_to_wav(track_number)
+        finally:
+            with self.rip_lock:
+                self.ripping_track = None
+                self.current_process = None
+
+    def _rip_track_to_wav(self, track_number):
         if not self.tracks:
             print("No tracks loaded")
             return None
+
+        cached = self.get_cached_track(track_number)
+        if cached:
+            print(f"Track {track_number} found in rip cache")
+            return cached
         
-        output_path = os.path.join(self.temp_dir, f"track_{track_number:02d}.wav")
+        output_path = self.get_output_path(track_number)
+
+        if self.cache and os.path.exists(output_path):
+            os.remove(output_path)
 
         if os.path.exists(output_path):
             print(f"Track {track_number} already ripped")
@@ -139,7 +244,13 @@ class CDAudioSource:
         if output_path not in self.ripped_files:
             self.ripped_files.append(output_path)
 
+        started = time.monotonic()
         try:
+            if self.backend:
+                print(f"Reading track {track_number}...")
+                sf.write(output_path, self.read_track(track_number), 44100, subtype='PCM_16')
+                return self._finish_rip(track_number, output_path, started)
+
             cd_drive = self._find_cd_drive()
             if not cd_drive:
                 print("Could not find CD drive")
@@ -148,33 +259,46 @@ class CDAudioSource:
             print(f"Ripping track {track_number}...")
             
             cmd = [
-                "freaccmd.exe",
+                *self.ripper_command,
                 f"--encoder=sndfile-wave",
                 f"--drive={cd_drive}:",
                 f"--track={track_number}",
                 "-o", output_path
             ]
             
-            self.current_process = subprocess.Popen(
+            process = subprocess.Popen(
                 cmd, 
                 stdout=subprocess.PIPE, 
                 stderr=subprocess.PIPE,
                 text=True
             )
+            with self.rip_lock:
+                self.current_process = process
+                if self.rip_cancelled:
+                    # preempted before the ripper even started
+                    process.kill()
             
             try:
-                stdout, stderr = self.current_process.communicate(timeout=120)
-                self.current_process = None
+                stdout, stderr = process.communicate(timeout=120)
             except subprocess.TimeoutExpired:
                 print(f"Ripping track {track_number} timed out.", flush=True)
-                if self.current_process:
-                    self.current_process.kill()
-                    self.current_process = None
+                process.kill()
                 return 
+
+            with self.rip_lock:
+                self.current_process = None
+                # a kill that arrived after the ripper exited cleanly does not cost the finished track
+                cancelled = self.rip_cancelled and process.returncode != 0
+
+            if cancelled:
+                print(f"Ripping track {track_number} cancelled.", flush=True)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+                return None
             
             if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
                 print(f"Successfully ripped track {track_number}")
-                return output_path
+                return self._finish_rip(track_number, output_path, started)
             else:
                 print(f"Rip failed.")
                 return None
@@ -193,16 +317,36 @@ class CDAudioSource:
             traceback.print_exc()
         return None
 
-    def stop_current_rip(self):
-        if self.current_process:
+    def _finish_rip(self, track_number, output_path, started):
+        elapsed = time.monotonic() - started
+        try:
+            audio_seconds = sf.info(output_path).duration
+        except RuntimeError:
+            audio_seconds = 0
+        RIP_SECONDS.inc(elapsed)
+        RIPPED_AUDIO_SECONDS.inc(audio_seconds)
+        if elapsed > 0:
+            RIP_REALTIME.set(audio_seconds / elapsed)
+            print(f"Ripped track {track_number} at {audio_seconds / elapsed:.1f}x real time")
+
+        if self.cache:
+            return self.cache.commit(self.disc.id, track_number, output_path)
+        return output_path
+
+    def stop_current_rip(self, track_number=None):
+        # with a track number, only that rip is stopped, never one that started since
+        with self.rip_lock:
+            if self.ripping_track is None or track_number not in (None, self.ripping_track):
+                return
+            self.rip_cancelled = True
+            process = self.current_process
+        if process:
             print("Killing active rip process...", flush=True)
             try:
-                self.current_process.kill()
-                self.current_process.wait(timeout=2)
+                process.kill()
+                process.wait(timeout=2)
             except Exception as e:
                 print(f"Error killing process: {e}", flush=True)
-            finally:
-                self.current_process = None
 
     def cleanup_temp_files(self):
         print(f"Starting cleanup of {len(self.ripped_files)} files...")
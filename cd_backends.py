@@ -0,0 +1,152 @@
+import ctypes
+import os
+import re
+import sys
+import discid
+import numpy as np
+
+SECTOR_BYTES = 2352
+FRAMES_PER_SECTOR = 588
+PREGAP_SECTORS = 150
+
+CDROMREADAUDIO = 0x530e
+CDROM_LBA = 0x01
+SECTORS_PER_READ = 32
+
+class _CdromAddr(ctypes.Union):
+    _fields_ = [('lba', ctypes.c_int), ('msf', ctypes.c_ubyte * 3)]
+
+class _CdromReadAudio(ctypes.Structure):
+    _fields_ = [
+        ('addr', _CdromAddr),
+        ('addr_format', ctypes.c_ubyte),
+        ('nframes', ctypes.c_int),
+        ('buf', ctypes.c_void_p),
+    ]
+
+def sector_buffer(count):
+    return np.zeros((count * FRAMES_PER_SECTOR, 2), dtype='<i2')
+
+class LinuxCDDABackend:
+    def __init__(self, device="/dev/cdrom"):
+        self.device = device
+        self.fd = None
+
+    def read_disc(self):
+        return discid.read(self.device)
+
+    def read_sectors(self, lba, count, out=None):
+        import fcntl
+
+        if self.fd is None:
+            self.fd = os.open(self.device, os.O_RDONLY | os.O_NONBLOCK)
+        if out is None:
+            out = sector_buffer(count)
+
+        request = _CdromReadAudio()
+        request.addr_format = CDROM_LBA
+        done = 0
+        while done < count:
+            chunk = min(SECTORS_PER_READ, count - done)
+            request.addr.lba = lba + done
+            request.nframes = chunk
+            request.buf = out.ctypes.data + done * SECTOR_BYTES
+            fcntl.ioctl(self.fd, CDROMREADAUDIO, request)
+            done += chunk
+        return out
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+class ImageFileBackend:
+    returns_views = True
+
+    def __init__(self, path):
+        self.cue_path = None
+        self.track_offsets = None
+        if path.lower().endswith('.cue'):
+            self.cue_path = path
+            path, self.track_offsets = self._parse_cue(path)
+
+        self.bin_path = path
+        self.samples = np.memmap(path, dtype='<i2', mode='r')
+        usable = len(self.samples) // (FRAMES_PER_SECTOR * 2) * FRAMES_PER_SECTOR
+        self.samples = self.samples[:usable * 2].reshape(usable, 2)
+        self.total_sectors = usable // FRAMES_PER_SECTOR
+
+        if not self.track_offsets:
+            self.track_offsets = [0]
+
+    def read_disc(self):
+        offsets = [offset + PREGAP_SECTORS for offset in self.track_offsets]
+        return discid.put(1, len(offsets), self.total_sectors + PREGAP_SECTORS, offsets)
+
+    def read_sectors(self, lba, count, out=None):
+        view = self.samples[lba * FRAMES_PER_SECTOR:(lba + count) * FRAMES_PER_SECTOR]
+        if out is None:
+            return view
+        out[:len(view)] = view
+        return out
+
+    def close(self):
+        self.samples = None
+
+    def _parse_cue(self, cue_path):
+        bin_path = None
+        offsets = []
+        with open(cue_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                file_match = re.match(r'FILE\s+"?(.+?)"?\s+BINARY$', line, re.IGNORECASE)
+                index_match = re.match(r'INDEX\s+01\s+(\d+):(\d+):(\d+)$', line, re.IGNORECASE)
+                if file_match:
+                    if bin_path:
+                        raise ValueError("Only single-file .cue sheets are supported")
+                    bin_path = os.path.join(os.path.dirname(cue_path), file_match.group(1))
+                elif index_match:
+                    minutes, seconds, frames = (int(part) for part in index_match.groups())
+                    offsets.append((minutes * 60 + seconds) * 75 + frames)
+
+        if not bin_path:
+            raise ValueError(f"No BINARY file in {cue_path}")
+        return bin_path, offsets
+
+class SectorSource:
+    def __init__(self, backend, offset, sectors):
+        self.backend = backend
+        self.first_lba = offset - PREGAP_SECTORS
+        self.frames = sectors * FRAMES_PER_SECTOR
+        self.samplerate = 44100
+        self.channels = 2
+        self.position = 0
+        self._buffer = sector_buffer(SECTORS_PER_READ + 1)
+
+    def seek(self, frame):
+        self.position = max(0, min(frame, self.frames))
+        return self.position
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        frames = max(0, min(frames, self.frames - self.position))
+        block = np.empty((frames, self.channels), dtype=dtype)
+
+        done = 0
+        while done < frames:
+            sector, skip = divmod(self.position, FRAMES_PER_SECTOR)
+            count = min(SECTORS_PER_READ, -(-(skip + frames - done) // FRAMES_PER_SECTOR))
+            out = None if getattr(self.backend, 'returns_views', False) else self._buffer[:count * FRAMES_PER_SECTOR]
+            pcm = self.backend.read_sectors(self.first_lba + sector, count, out)
+            take = min(frames - done, count * FRAMES_PER_SECTOR - skip)
+            np.multiply(pcm[skip:skip + take], 1 / 32768, out=block[done:done + take], casting='unsafe')
+            done += take
+            self.position += take
+        return block
+
+    def close(self):
+        pass
+
+def default_backend():
+    if sys.platform.startswith("linux"):
+        return LinuxCDDABackend()
+    return None
@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import sys
+import threading
+import soundfile as sf
+from app_paths import get_cache_dir
+from metadata_cache import find_medium
+
+COLUMNS = ('key', 'disc_id', 'number', 'path', 'title', 'album', 'artist', 'disc_number', 'duration')
+
+def disc_key(disc_id, number):
+    return f"{disc_id}/{number:02d}"
+
+def parse_number(value):
+    # tags like "3/12" or "2 of 8"
+    digits = ''
+    for char in str(value or '').strip():
+        if not char.isdigit():
+            break
+        digits += char
+    return int(digits) if digits else 0
+
+def album_key(entry):
+    # two artists' albums of the same name stay apart; the discs of one box set share a key
+    return entry.get('artist', ''), entry['album']
+
+def release_tracks(release, disc_id, track_count=None):
+    medium = find_medium(release, disc_id, track_count)
+    album = {
+        'album': release['title'],
+        'artist': release.get('artist-credit-phrase', ''),
+        'disc_number': parse_number(medium.get('position')) if len(release['medium-list']) > 1 else 0,
+    }
+    titles = {parse_number(track.get('position')) or i + 1: track['recording']['title']
+              for i, track in enumerate(medium['track-list'])}
+    return album, titles
+
+class Library:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_cache_dir("library"), "library.db")
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks (key TEXT PRIMARY KEY, disc_id TEXT, number INTEGER, path TEXT, "
+            "title TEXT, album TEXT, artist TEXT, disc_number INTEGER, duration REAL)"
+        )
+        self.db.commit()
+        self.lock = threading.Lock()
+        self.tracks = {}
+        self.by_album = {}
+        self.by_disc = {}
+        self.by_title = {}
+        self._sorted_albums = set()
+        self._load()
+
+    def get(self, key):
+        return self.tracks.get(key)
+
+    def disc_track(self, disc_id, number):
+        key = self.by_disc.get(disc_id, {}).get(number)
+        return self.tracks.get(key) if key else None
+
+    def find_title(self, title):
+        return [self.tracks[key] for key in self.by_title.get(title.casefold(), [])]
+
+    def albums(self):
+        return sorted(self.by_album, key=lambda key: (key[1].casefold(), key[0].casefold()))
+
+    def album_tracks(self, album):
+        keys = self.by_album.get(album, [])
+        if album not in self._sorted_albums:
+            keys.sort(key=self._album_order)
+            self._sorted_albums.add(album)
+        return [self.tracks[key] for key in keys]
+
+    def queue(self, albums=None, playable=None):
+        entries = []
+        for album in albums or self.albums():
+            for entry in self.album_tracks(album):
+                if playable is None or playable(entry):
+                    entries.append(entry)
+        return entries
+
+    def add_disc(self, disc_id, disc_info, tracks):
+        # tracks as CDAudioSource hands them out; a later call with MusicBrainz titles overwrites the generic ones
+        disc_info = disc_info or {}
+        album = disc_info.get('album') or f"Disc {disc_id}"
+        disc_number = parse_number(disc_info.get('disc_number'))
+        entries = []
+        for track in tracks:
+            existing = self.disc_track(disc_id, track['number']) or {}
+            entries.append({
+                'key': disc_key(disc_id, track['number']),
+                'disc_id': disc_id,
+                'number': track['number'],
+                'title': track['title'],
+                'album': album,
+                'artist': disc_info.get('artist', ''),
+                'disc_number': disc_number,
+                'duration': track.get('frames', 0) / 44100 or existing.get('duration'),
+            })
+        return self._store(entries)
+
+    def sync_rip_cache(self, cache, metadata_cache=None):
+        # only tracks the catalog has not seen yet are opened, so a known box set costs nothing here
+        added = []
+        for disc_id in cache.disc_ids():
+            release = metadata_cache.cached_release(disc_id) if metadata_cache else None
+            cached = cache.cached_tracks(disc_id)
+            # a disc added from the drive knows its track count, a partial rip only hints at it
+            track_count = len(self.by_disc.get(disc_id) or cached)
+            album, titles = release_tracks(release, disc_id, track_count) if release else ({}, {})
+            for number, path in sorted(cached.items()):
+                existing = self.disc_track(disc_id, number)
+                if existing and (not release or existing['album'] == album['album']):
+                    continue
+                entry = {
+                    'key': disc_key(disc_id, number),
+                    'disc_id': disc_id,
+                    'number': number,
+                    'title': titles.get(number) or (existing or {}).get('title') or f"Track {number}",
+                    'album': album.get('album') or (existing or {}).get('album') or f"Disc {disc_id}",
+                    'artist': album.get('artist', ''),
+                    'disc_number': album.get('disc_number', 0),
+                    'duration': (existing or {}).get('duration') or self._duration(path),
+                }
+                added.append(entry)
+        return self._store(added)
+
+    def add_folder_entries(self, entries):
+        added = []
+        for entry in entries:
+            album = entry.get('album') or os.path.basename(os.path.dirname(entry['path']))
+            added.append({
+                'key': entry['path'],
+                'path': entry['path'],
+                'number': parse_number(entry.get('tracknumber')) or None,
+                'title': entry['title'],
+                'album': album,
+                'artist': entry.get('artist', ''),
+                'disc_number': 0,
+                'duration': entry.get('duration'),
+            })
+        return self._store(added)
+
+    def remove_paths(self, paths):
+        with self.lock:
+            removed = [path for path in paths if path in self.tracks]
+            for path in removed:
+                self._unindex(self.tracks.pop(path))
+            self.db.executemany("DELETE FROM tracks WHERE key = ?", [(path,) for path in removed])
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _store(self, entries):
+        if not entries:
+            return []
+        with self.lock:
+            changed = []
+            stored = []
+            for entry in entries:
+                entry = {column: value for column, value in entry.items() if value is not None}
+                old = self.tracks.get(entry['key'])
+                if old == entry:
+                    continue
+                if old:
+                    # keep the dict the playlist already holds, so a title update shows up in place
+                    self._unindex(old)
+                    old.clear()
+                    old.update(entry)
+                    entry = old
+                self._index(entry)
+                stored.append(entry)
+                changed.append(tuple(entry.get(column) for column in COLUMNS))
+            if changed:
+                self.db.executemany(
+                    f"INSERT OR REPLACE INTO tracks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    changed
+                )
+                self.db.commit()
+        return stored
+
+    def _load(self):
+        for row in self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM tracks"):
+            entry = {column: value for column, value in zip(COLUMNS, row) if value is not None}
+            self._index(entry)
+
+    def _index(self, entry):
+        key = entry['key']
+        self.tracks[key] = entry
+        self.by_album.setdefault(album_key(entry), []).append(key)
+        self._sorted_albums.discard(album_key(entry))
+        if 'disc_id' in entry:
+            self.by_disc.setdefault(entry['disc_id'], {})[entry['number']] = key
+        self.by_title.setdefault(entry['title'].casefold(), []).append(key)
+
+    def _unindex(self, entry):
+        key = entry['key']
+        album = album_key(entry)
+        self.by_album[album].remove(key)
+        if not self.by_album[album]:
+            del self.by_album[album]
+        if 'disc_id' in entry:
+            self.by_disc[entry['disc_id']].pop(entry['number'], None)
+        titles = self.by_title[entry['title'].casefold()]
+        titles.remove(key)
+        if not titles:
+            del self.by_title[entry['title'].casefold()]
+
+    def _album_order(self, key):
+        entry = self.tracks[key]
+        return entry.get('disc_number', 0), entry.get('disc_id', ''), entry.get('number', 0), entry.get('path', '')
+
+    def _duration(self, path):
+        try:
+            return sf.info(path).duration
+        except Exception as e:
+            print(f"Could not read {path}: {e}")
+            return None
+
+if __name__ == "__main__":
+    from rip_cache import RipCache
+    from metadata_cache import MetadataCache
+    from library_index import FolderIndex
+
+    library = Library()
+    library.sync_rip_cache(RipCache(), MetadataCache())
+    for folder in sys.argv[1:]:
+        index = FolderIndex(folder)
+        library.add_folder_entries(index.cached_entries())
+        index.scan(lambda chunk: library.add_folder_entries([entry for entry, _ in chunk]), library.remove_paths)
+
+    total = 0
+    for artist, album in library.albums():
+        tracks = library.album_tracks((artist, album))
+        seconds = sum(track.get('duration') or 0 for track in tracks)
+        total += seconds
+        print(f"{artist + ' - ' if artist else ''}{album}: {len(tracks)} tracks, {int(seconds // 60)}:{int(seconds % 60):02d}")
+    print(f"{len(library.tracks)} tracks, {total / 3600:.1f} hours")
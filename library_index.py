@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import soundfile as sf
+from app_paths import get_cache_dir
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.wav', '.ogg', '.opus', '.aiff', '.aif')
+CHUNK_SIZE = 500
+READER_WORKERS = 8
+
+def read_header(path):
+    info = sf.info(path)
+    entry = {
+        'path': path,
+        'title': os.path.splitext(os.path.basename(path))[0],
+        'duration': info.duration,
+        'samplerate': info.samplerate,
+        'channels': info.channels,
+        'frames': info.frames,
+    }
+    try:
+        with sf.SoundFile(path) as f:
+            tags = f.copy_metadata()
+    except Exception:
+        tags = {}
+    for tag in ('title', 'artist', 'album', 'tracknumber'):
+        if tags.get(tag):
+            entry[tag] = tags[tag]
+    return entry
+
+class FolderIndex:
+    def __init__(self, root, index_path=None):
+        self.root = os.path.abspath(root)
+        if not index_path:
+            digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()
+            index_path = os.path.join(get_cache_dir("index"), f"{digest}.json")
+        self.index_path = index_path
+        self.entries = self._load()
+        self._stop = False
+        self._thread = None
+
+    def cached_entries(self):
+        return [self.entries[path] for path in sorted(self.entries)]
+
+    def scan_async(self, on_chunk, on_done=None):
+        self._thread = threading.Thread(target=self.scan, args=(on_chunk, on_done), daemon=True)
+        self._thread.start()
+
+    def scan(self, on_chunk, on_done=None):
+        seen = set()
+        fresh = {}
+        batch = []
+
+        with ThreadPoolExecutor(max_workers=READER_WORKERS) as pool:
+            for path, stat in self._walk(self.root):
+                if self._stop:
+                    return
+                seen.add(path)
+                cached = self.entries.get(path)
+                if cached and cached.get('mtime') == stat.st_mtime and cached.get('size') == stat.st_size:
+                    fresh[path] = cached
+                    continue
+                batch.append((path, stat))
+                if len(batch) >= CHUNK_SIZE:
+                    on_chunk(self._read_batch(pool, batch, fresh))
+                    batch = []
+
+            if batch:
+                on_chunk(self._read_batch(pool, batch, fresh))
+
+        removed = [path for path in self.entries if path not in seen]
+        self.entries = fresh
+        self._save()
+        if on_done:
+            on_done(removed)
+
+    def stop(self):
+        self._stop = True
+
+    def _read_batch(self, pool, batch, fresh):
+        def read(item):
+            path, stat = item
+            try:
+                entry = read_header(path)
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                return None
+            entry['mtime'] = stat.st_mtime
+            entry['size'] = stat.st_size
+            return entry
+
+        chunk = []
+        for entry in pool.map(read, batch):
+            if entry:
+                known = entry['path'] in self.entries
+                fresh[entry['path']] = entry
+                chunk.append((entry, known))
+        return chunk
+
+    def _walk(self, folder):
+        try:
+            with os.scandir(folder) as it:
+                children = sorted(it, key=lambda entry: entry.name.lower())
+        except OSError as e:
+            print(f"Cannot scan {folder}: {e}")
+            return
+
+        for child in children:
+            if child.is_dir(follow_symlinks=False):
+                yield from self._walk(child.path)
+            elif child.name.lower().endswith(AUDIO_EXTENSIONS):
+                yield child.path, child.stat()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        staging = self.index_path + ".tmp"
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(staging, self.index_path)
@@ -0,0 +1,150 @@
+import numpy as np
+from PyQt6.QtWidgets import QWidget, QGridLayout
+from spectrum import SpectrumEngine
+from visualizer import AudioVisualizer, SampleTap, FrameClock
+
+SAMPLE_RATE = 44100
+CHUNK_SIZE = 1024
+FFT_SIZE = 1024
+MAX_COLUMNS = 4
+
+def parse_stream_spec(spec):
+    # "CABLE Output" mixes the device down to one stream, "CABLE Output:1,2" gives one stream per channel
+    name, separator, channels = spec.rpartition(':')
+    if separator:
+        try:
+            return name, [int(channel) - 1 for channel in channels.split(',')]
+        except ValueError:
+            pass
+    return spec, None
+
+def find_input_device(name_keyword):
+    import sounddevice as sd
+
+    if not name_keyword:
+        return sd.default.device[0]
+    for i, device in enumerate(sd.query_devices()):
+        if device['max_input_channels'] > 0 and name_keyword.lower() in device['name'].lower():
+            return i
+    return None
+
+class LiveStream:
+    def __init__(self, label, channel=None):
+        self.label = label
+        self.channel = channel
+        self.tap = SampleTap(FFT_SIZE * 8)
+
+class LiveCapture:
+    def __init__(self, specs, samplerate=SAMPLE_RATE, blocksize=CHUNK_SIZE):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.streams = []
+        self.input_streams = []
+        for spec in specs or ['']:
+            self._open_device(spec)
+
+    def _open_device(self, spec):
+        import sounddevice as sd
+
+        name, channels = parse_stream_spec(spec)
+        device = find_input_device(name)
+        if device is None:
+            print(f"No input device matching '{name}'")
+            return
+
+        info = sd.query_devices(device, 'input')
+        device_channels = info['max_input_channels']
+        if channels is None:
+            streams = [LiveStream(info['name'])]
+        else:
+            streams = [LiveStream(f"{info['name']} ch{channel + 1}", channel)
+                       for channel in channels if 0 <= channel < device_channels]
+        if not streams:
+            print(f"{info['name']} has no channels {spec.rpartition(':')[2]}")
+            return
+
+        try:
+            stream = sd.InputStream(
+                callback=self._make_callback(streams),
+                device=device,
+                channels=device_channels,
+                samplerate=self.samplerate,
+                blocksize=self.blocksize
+            )
+            stream.start()
+        except Exception as e:
+            print(f"Could not open {info['name']}: {e}")
+            return
+        self.input_streams.append(stream)
+        self.streams.extend(streams)
+
+    def _make_callback(self, streams):
+        mixed = np.zeros(self.blocksize, dtype=np.float32)
+
+        def callback(indata, frames, time, status):
+            if status:
+                print(status)
+            for stream in streams:
+                if stream.channel is None:
+                    np.mean(indata, axis=1, out=mixed[:frames])
+                    stream.tap.push(mixed[:frames])
+                else:
+                    stream.tap.push(indata[:, stream.channel])
+
+        return callback
+
+    def close(self):
+        for stream in self.input_streams:
+            try:
+                stream.stop()
+                stream.close()
+            except Exception as e:
+                print(f"Error stopping input stream: {e}")
+        self.input_streams = []
+
+class LiveAnalyzerWindow(QWidget):
+    def __init__(self, capture, num_bars=20, smoothing=0.7):
+        super().__init__()
+        self.capture = capture
+        self.streams = capture.streams
+        self.engine = SpectrumEngine(len(self.streams), FFT_SIZE, num_bars, capture.samplerate)
+        self.analyzed = [0] * len(self.streams)
+
+        self.setWindowTitle("Live Input")
+        layout = QGridLayout(self)
+        columns = min(MAX_COLUMNS, max(1, len(self.streams)))
+        self.visualizers = []
+        for i, stream in enumerate(self.streams):
+            visualizer = AudioVisualizer(num_bars=num_bars, smoothing=smoothing, sample_rate=capture.samplerate,
+                                         fft_size=FFT_SIZE, title=stream.label)
+            # one timer and one batched FFT drive every stream
+            visualizer.timer.stop()
+            visualizer.win.setTitle(stream.label, color='#ccc', size='9pt')
+            layout.addWidget(visualizer.win, i // columns, i % columns)
+            self.visualizers.append(visualizer)
+        rows = max(1, -(-len(self.streams) // columns))
+        self.resize(400 * columns, 300 * rows)
+
+        self.clock = FrameClock()
+        self.timer = self.clock.start_timer(self._on_frame)
+
+    def _on_frame(self):
+        frames = self.clock.tick()
+        if not frames:
+            return
+
+        changed = False
+        for i, stream in enumerate(self.streams):
+            if stream.tap.write_index != self.analyzed[i]:
+                self.analyzed[i] = stream.tap.latest(self.engine.frames[i])
+                changed = True
+        if changed:
+            self.engine.analyze()
+
+        for visualizer, heights in zip(self.visualizers, self.engine.bars):
+            visualizer.show_heights(heights, frames)
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.capture.close()
+        event.accept()
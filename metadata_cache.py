@@ -0,0 +1,50 @@
+import json
+import os
+import time
+from app_paths import get_cache_dir
+
+DEFAULT_TTL = 30 * 24 * 60 * 60
+
+def find_medium(release, disc_id, track_count=None):
+    mediums = release['medium-list']
+    for medium in mediums:
+        for disc in medium.get('disc-list', []):
+            if disc['id'] == disc_id:
+                return medium
+    if track_count:
+        for medium in mediums:
+            if len(medium['track-list']) == track_count:
+                return medium
+    return mediums[0]
+
+class MetadataCache:
+    def __init__(self, root=None, ttl=DEFAULT_TTL):
+        self.root = root or get_cache_dir("metadata")
+        self.ttl = ttl
+
+    def get(self, disc_id):
+        try:
+            with open(self._path(disc_id), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get('fetched', 0) > self.ttl:
+            return None
+        return entry.get('result')
+
+    def cached_release(self, disc_id):
+        entry = self.get(disc_id)
+        if not entry or 'release-id' not in entry:
+            return None
+        return self.get(f"release-{entry['release-id']}")
+
+    def put(self, disc_id, result):
+        path = self._path(disc_id)
+        staging = path + ".tmp"
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump({'fetched': time.time(), 'result': result}, f)
+        os.replace(staging, path)
+
+    def _path(self, disc_id):
+        return os.path.join(self.root, f"{disc_id}.json")
@@ -0,0 +1,216 @@
+import bisect
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PREFIX = "expedition_"
+DURATION_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05]
+WRITE_INTERVAL_SECONDS = 5
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def collect(self):
+        if self.fn:
+            return self.fn()
+        return self.value
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def collect(self):
+        if self.fn:
+            try:
+                return float(self.fn())
+            except Exception:
+                return float('nan')
+        return self.value
+
+class Histogram:
+    kind = "histogram"
+
+    # observed from a single thread (the audio callback), so no lock
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def collect(self):
+        cumulative = []
+        total = 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return {
+            'buckets': dict(zip([*self.buckets, float('inf')], cumulative)),
+            'sum': self.sum,
+            'count': self.count,
+            'max': self.max,
+        }
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, fn=None):
+        return self._register(Counter, name, help_text, fn)
+
+    def gauge(self, name, help_text, fn=None):
+        return self._register(Gauge, name, help_text, fn)
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, help_text, buckets)
+
+    def _register(self, cls, name, help_text, arg):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help_text, arg)
+            elif arg is not None and cls is not Histogram:
+                # a newer player/scheduler instance takes over the function
+                metric.fn = arg
+            return metric
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return {metric.name: metric.collect() for metric in metrics}
+
+    def to_json(self):
+        snapshot = self.snapshot()
+        for value in snapshot.values():
+            if isinstance(value, dict):
+                value['buckets'] = {format_value(bound): count for bound, count in value['buckets'].items()}
+        return json.dumps(snapshot, indent=2)
+
+    def to_prometheus(self):
+        with self._lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            name = PREFIX + metric.name
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            value = metric.collect()
+            if metric.kind == "histogram":
+                for bound, count in value['buckets'].items():
+                    lines.append(f'{name}_bucket{{le="{format_value(bound)}"}} {count}')
+                lines.append(f"{name}_sum {value['sum']}")
+                lines.append(f"{name}_count {value['count']}")
+            else:
+                lines.append(f"{name} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def format_value(value):
+    if value != value:
+        return "NaN"
+    return "+Inf" if value == float("inf") else repr(value)
+
+REGISTRY = MetricsRegistry()
+
+class MetricsFileWriter:
+    def __init__(self, path, registry=REGISTRY, interval=WRITE_INTERVAL_SECONDS):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self):
+        text = self.registry.to_json() if self.path.endswith('.json') else self.registry.to_prometheus()
+        partial = self.path + ".partial"
+        try:
+            with open(partial, 'w') as f:
+                f.write(text)
+            os.replace(partial, self.path)
+        except OSError as e:
+            print(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+class MetricsServer:
+    def __init__(self, port, registry=REGISTRY, host="127.0.0.1"):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = registry_ref.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = registry_ref.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        print(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_exporters(registry=REGISTRY):
+    exporters = []
+    port = os.environ.get("EXPEDITION_METRICS_PORT")
+    path = os.environ.get("EXPEDITION_METRICS_FILE")
+    if port:
+        try:
+            exporters.append(MetricsServer(int(port), registry))
+        except (OSError, ValueError) as e:
+            print(f"Could not serve metrics on port {port}: {e}")
+    if path:
+        exporters.append(MetricsFileWriter(path, registry))
+    return exporters
@@ -0,0 +1,52 @@
+from PyQt6.QtWidgets import QLabel
+from PyQt6.QtCore import QTimer
+from metrics import REGISTRY
+
+REFRESH_MS = 500
+
+class MetricsPanel(QLabel):
+    def __init__(self, parent=None, registry=REGISTRY):
+        super().__init__(parent)
+        self.registry = registry
+        self.setStyleSheet(
+            "background-color: rgba(0, 0, 0, 180); color: #9f9; "
+            "font-family: monospace; font-size: 9pt; padding: 6px;"
+        )
+        self.move(8, 8)
+        self.hide()
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.refresh)
+
+    def toggle(self):
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start(REFRESH_MS)
+
+    def refresh(self):
+        values = self.registry.snapshot()
+        lines = []
+
+        callback = values.get('callback_duration_seconds')
+        if callback and callback['count']:
+            mean = callback['sum'] / callback['count'] * 1e6
+            lines.append(f"callback  mean {mean:6.1f} us  max {callback['max'] * 1e6:7.1f} us")
+
+        lines.append(f"underflow {values.get('output_underflows_total', 0)}  "
+                     f"overflow {values.get('output_overflows_total', 0)}  "
+                     f"short reads {values.get('decoder_short_reads_total', 0)}")
+        if 'ring_fill_ratio' in values:
+            lines.append(f"buffer    {values['ring_fill_ratio'] * 100:5.1f}% full")
+        if 'decode_realtime_factor' in values:
+            lines.append(f"decode    {values['decode_realtime_factor']:6.1f}x real time")
+        if 'rip_realtime_factor' in values:
+            lines.append(f"rip       {values['rip_realtime_factor']:6.1f}x real time, "
+                         f"{values.get('rip_queue_depth', 0):.0f} queued")
+
+        self.setText("\n".join(lines))
+        self.adjustSize()
@@ -0,0 +1,406 @@
+import bisect
+import threading
+import time
+from collections import deque
+import numpy as np
+import soundfile as sf
+from audio_stream import open_track_stream, TrackSequencer, PlaybackMixer
+from metrics import REGISTRY
+from track_analysis import estimate_loudness, loudness_gain_db
+
+SAMPLE_RATE = 44100
+CHUNK_SIZE = 1024
+CONTROL_POLL_SECONDS = 0.05
+MAX_BOOST_DB = 12.0
+
+TRACK_CHANGED = "track_changed"
+STATE_CHANGED = "state_changed"
+OUTPUT_STATUS = "output_status"
+
+STOPPED = "stopped"
+PLAYING = "playing"
+PAUSED = "paused"
+
+CALLBACK_SECONDS = REGISTRY.histogram("callback_duration_seconds", "Time spent rendering one output block")
+UNDERFLOWS = REGISTRY.counter("output_underflows_total", "Blocks the output device reported as underflowed")
+OVERFLOWS = REGISTRY.counter("output_overflows_total", "Blocks the output device reported as overflowed")
+
+def query_output_rate():
+    try:
+        import sounddevice as sd
+        return int(sd.query_devices(kind='output')['default_samplerate'])
+    except Exception as e:
+        print(f"Could not query output device, using {SAMPLE_RATE} Hz: {e}")
+        return SAMPLE_RATE
+
+class SoundDeviceOutput:
+    def __init__(self, samplerate=None, blocksize=CHUNK_SIZE):
+        self.samplerate = samplerate or query_output_rate()
+        self.blocksize = blocksize
+        self.stream = None
+        self._callback = None
+
+    def start(self, callback):
+        import sounddevice as sd
+
+        self._callback = callback
+        if not self.stream:
+            self.stream = sd.OutputStream(
+                callback=self._stream_callback,
+                channels=2,
+                samplerate=self.samplerate,
+                blocksize=self.blocksize
+            )
+        self.stream.start()
+
+    def stop(self):
+        if self.stream:
+            self.stream.stop()
+
+    def close(self):
+        if self.stream:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except Exception as e:
+                print(f"Error stopping stream: {e}")
+            self.stream = None
+
+    def _stream_callback(self, outdata, frames, time, status):
+        self._callback(outdata, frames, status)
+
+class NullOutput:
+    def __init__(self, samplerate=SAMPLE_RATE, blocksize=CHUNK_SIZE, speed=1.0):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.speed = speed
+        self.frames_written = 0
+        self._callback = None
+        self._running = False
+        self._thread = None
+
+    def start(self, callback):
+        self._callback = callback
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+
+    def close(self):
+        self.stop()
+
+    def write(self, block):
+        pass
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, 2), dtype=np.float32)
+        deadline = time.monotonic()
+        while self._running:
+            self._callback(outdata, self.blocksize, None)
+            self.write(outdata)
+            self.frames_written += self.blocksize
+
+            if self.speed:
+                deadline += self.blocksize / self.samplerate / self.speed
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+class FileOutput(NullOutput):
+    def __init__(self, path, samplerate=SAMPLE_RATE, blocksize=CHUNK_SIZE, speed=1.0):
+        super().__init__(samplerate, blocksize, speed)
+        self.path = path
+        self.file = None
+
+    def write(self, block):
+        if self.file is None:
+            self.file = sf.SoundFile(self.path, 'w', self.samplerate, 2, subtype='PCM_16')
+        self.file.write(block)
+
+    def close(self):
+        super().close()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class PlaybackEngine:
+    def __init__(self, get_source, playlist, output=None, crossfade_seconds=0, normalize=False, get_gain=None):
+        self.get_source = get_source
+        self.playlist = playlist
+        self.output = output or SoundDeviceOutput()
+        self.output_rate = self.output.samplerate
+        self.sequencer = TrackSequencer(int(crossfade_seconds * self.output_rate))
+        self.mixer = PlaybackMixer(self.sequencer, self.output.blocksize, samplerate=self.output_rate, limiter=normalize)
+        self.normalize = normalize
+        self.get_gain = get_gain
+        self.estimated_gains = {}
+        self.estimating = set()
+        self._estimate_lock = threading.Lock()
+        self.on_block = None
+        self.events = deque(maxlen=256)
+
+        self.current_index = 0
+        self.position = 0
+        self.total_frames = 0
+        self.state = STOPPED
+        self.underflows = 0
+
+        self.prepare_generation = 0
+        self.seen_advance_count = 0
+        self._lock = threading.RLock()
+        self._closing = threading.Event()
+        self._control_thread = threading.Thread(target=self._control_loop, daemon=True)
+        self._control_thread.start()
+
+        REGISTRY.gauge("ring_fill_ratio", "How full the current track's decode buffer is", fn=self.ring_fill)
+        REGISTRY.counter("decoder_short_reads_total", "Blocks rendered before the decoder had enough audio",
+                         fn=lambda: self.sequencer.short_reads)
+
+    @property
+    def is_playing(self):
+        return self.state == PLAYING
+
+    @property
+    def is_loaded(self):
+        return self.sequencer.current is not None
+
+    def ring_fill(self):
+        current = self.sequencer.current
+        ring = getattr(current, 'ring', None)
+        if ring is None:
+            return 1.0 if current else 0.0
+        return ring.available() / ring.capacity
+
+    def poll_events(self):
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def load(self, index=None):
+        with self._lock:
+            if not self.playlist:
+                print("No audio files found in the folder.")
+                return False
+            if index is not None:
+                self.current_index = index % len(self.playlist)
+
+            source = self.get_source(self.current_index, True)
+            if not source:
+                return False
+
+            decoder = open_track_stream(source, self.output_rate)
+            self.apply_track_gain(decoder, self.current_index)
+            self.sequencer.set_current(decoder, self.current_index)
+            self.position = 0
+            self.total_frames = self.sequencer.current.total_frames
+            self.close_retired_decoders()
+            self.events.append((TRACK_CHANGED, self.current_index))
+            self.prepare_next_track()
+            return True
+
+    def prepare_next_track(self, index=None):
+        with self._lock:
+            self.prepare_generation += 1
+            generation = self.prepare_generation
+            if index is None:
+                index = (self.current_index + 1) % len(self.playlist)
+
+        def prepare_worker():
+            source = self.get_source(index, False)
+            if not source or generation != self.prepare_generation:
+                return
+
+            decoder = open_track_stream(source, self.output_rate)
+            self.apply_track_gain(decoder, index)
+            # load, select and a playlist edit bump the generation under the lock
+            with self._lock:
+                if generation == self.prepare_generation:
+                    self.sequencer.queue_next(decoder, index)
+                    return
+            decoder.close()
+
+        threading.Thread(target=prepare_worker, daemon=True).start()
+
+    def apply_track_gain(self, decoder, index):
+        if not self.normalize:
+            decoder.gain = 1.0
+            return
+
+        gain_db = self.get_gain(index) if self.get_gain else None
+        path = getattr(decoder, 'path', None)
+        if gain_db is None and path:
+            gain_db = self.estimated_gains.get(path)
+        if gain_db is None:
+            decoder.gain = 1.0
+            # a track still being ripped cannot be sampled ahead of the read position
+            if path and not getattr(getattr(decoder, 'file', None), 'pending', False):
+                with self._estimate_lock:
+                    if path in self.estimating:
+                        return
+                    self.estimating.add(path)
+                threading.Thread(target=self._estimate_gain, args=(path,), daemon=True).start()
+            return
+        decoder.gain = 10 ** (min(gain_db, MAX_BOOST_DB) / 20)
+
+    def _estimate_gain(self, path):
+        try:
+            gain_db = loudness_gain_db(estimate_loudness(path))
+        except Exception as e:
+            print(f"Could not estimate loudness of {path}: {e}")
+            gain_db = None
+        with self._estimate_lock:
+            if gain_db is not None:
+                self.estimated_gains[path] = gain_db
+            self.estimating.discard(path)
+        if gain_db is None:
+            return
+        if not self.normalize:
+            return
+        # whichever decoders play the track by now, not the one that asked first
+        for decoder in (self.sequencer.current, self.sequencer.next):
+            if decoder is not None and getattr(decoder, 'path', None) == path:
+                decoder.gain = 10 ** (min(gain_db, MAX_BOOST_DB) / 20)
+
+    def set_normalize(self, enabled):
+        self.normalize = enabled
+        self.mixer.limiter = enabled
+        for decoder, index in (self.sequencer.playing, self.sequencer.queued):
+            if decoder is not None:
+                self.apply_track_gain(decoder, index)
+
+    def close_retired_decoders(self, force=False):
+        for decoder in self.sequencer.collect_retired(force):
+            decoder.close()
+
+    def play(self):
+        if not self.is_loaded:
+            return
+        self.output.start(self.render)
+        self._set_state(PLAYING)
+
+    def pause(self):
+        self.output.stop()
+        self._set_state(PAUSED)
+
+    def toggle_play_pause(self):
+        if self.is_playing:
+            self.pause()
+        else:
+            self.play()
+
+    def stop(self):
+        self.output.stop()
+        self.position = 0
+        if self.sequencer.current:
+            self.sequencer.current.seek(0)
+        self._set_state(STOPPED)
+
+    def rows_inserted(self, rows):
+        # rows are positions in the grown playlist, ascending
+        def remap(index):
+            for row in rows:
+                if row > index:
+                    break
+                index += 1
+            return index
+        if rows:
+            self._remap_indexes(remap, ())
+
+    def rows_removed(self, rows):
+        # rows are positions in the playlist before the removal, ascending
+        if rows:
+            self._remap_indexes(lambda index: index - bisect.bisect_left(rows, index), set(rows))
+
+    def _remap_indexes(self, remap, removed):
+        with self._lock:
+            if not self.is_loaded:
+                return
+            current_removed = self.current_index in removed
+            if not self.playlist:
+                self.current_index = 0
+                self.prepare_generation += 1
+                self.sequencer.queue_next(None)
+                return
+            self.current_index = min(remap(self.current_index), len(self.playlist) - 1)
+
+            # once the playing row is gone, the row that took its place plays next
+            index = self.current_index if current_removed else (self.current_index + 1) % len(self.playlist)
+            next_tag = self.sequencer.next_tag
+            if self.sequencer.next is not None and next_tag not in removed and remap(next_tag) == index:
+                self.sequencer.retag(remap)
+            else:
+                self.sequencer.retag(remap, queued=False)
+                self.sequencer.queue_next(None)
+                self.prepare_next_track(index)
+
+    def next_track(self):
+        self.select(self.current_index + 1)
+
+    def previous_track(self):
+        self.select(self.current_index - 1)
+
+    def select(self, index):
+        was_playing = self.is_playing
+        self.stop()
+        self.load(index)
+        if was_playing:
+            self.play()
+
+    def seek(self, frame):
+        self.position = max(0, min(int(frame), self.total_frames))
+        if self.sequencer.current:
+            self.sequencer.current.seek(self.position)
+
+    def set_volume(self, volume):
+        self.mixer.volume = volume
+
+    def close(self):
+        self._closing.set()
+        self.output.close()
+        self._control_thread.join(timeout=1)
+        with self._lock:
+            self.prepare_generation += 1
+            self.sequencer.set_current(None)
+            self.close_retired_decoders(force=True)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.events.append((STATE_CHANGED, state))
+
+    def render(self, outdata, frames, status=None):
+        started = time.perf_counter()
+        if status:
+            if getattr(status, 'output_underflow', False):
+                self.underflows += 1
+                UNDERFLOWS.inc()
+            if getattr(status, 'output_overflow', False):
+                OVERFLOWS.inc()
+            self.events.append((OUTPUT_STATUS, str(status)))
+
+        chunk_mono = self.mixer.render(outdata, frames)
+        if self.sequencer.current:
+            self.position = self.sequencer.current.position
+
+        if self.on_block:
+            self.on_block(chunk_mono)
+        CALLBACK_SECONDS.observe(time.perf_counter() - started)
+
+    def _control_loop(self):
+        while not self._closing.wait(CONTROL_POLL_SECONDS):
+            if self.sequencer.advance_count == self.seen_advance_count:
+                continue
+            with self._lock:
+                self.seen_advance_count = self.sequencer.advance_count
+                decoder, self.current_index = self.sequencer.playing
+                self.total_frames = decoder.total_frames
+                self.close_retired_decoders()
+                self.events.append((TRACK_CHANGED, self.current_index))
+                self.prepare_next_track()
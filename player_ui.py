@@ -2,39 +2,61 @@
 
 import os
 import sys
-import numpy as np
-from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSlider, QLabel, QListWidget)
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSlider, QLabel, QListView,
+                             QCheckBox)
+from PyQt6.QtCore import Qt, QTimer, QObject, pyqtSignal
+from PyQt6.QtGui import QShortcut, QKeySequence
 from visualizer import AudioVisualizer
-import soundfile as sf
-import sounddevice as sd
-import threading
+from metrics import start_exporters
+from metrics_panel import MetricsPanel
+from waveform_slider import WaveformSlider
+from playlist_model import PlaylistModel
+from library_index import FolderIndex
+from audio_stream import GrowingWavSource
+from playback_engine import PlaybackEngine, TRACK_CHANGED, STATE_CHANGED, OUTPUT_STATUS, PLAYING, STOPPED
+from rip_scheduler import RipScheduler, RIPPING, DONE, FAILED, PRIORITY_PLAYING, PRIORITY_NEXT
 
-SAMPLE_RATE = 44100
-CHUNK_SIZE = 1024
+CROSSFADE_SECONDS = 0
+NORMALIZE = True
+
+class MetadataSignals(QObject):
+    tracks_ready = pyqtSignal(list)
+
+class AnalysisSignals(QObject):
+    analysis_ready = pyqtSignal(str, int)
+
+class IndexSignals(QObject):
+    chunk_ready = pyqtSignal(list)
+    scan_done = pyqtSignal(list)
 
 class MediaPlayerUI(QMainWindow):
-    def __init__(self, source_path=None, is_cd=False):
+    def __init__(self, source_path=None, is_cd=False, crossfade_seconds=CROSSFADE_SECONDS, cd_backend=None, library=False):
         super().__init__()
         self.source_path = source_path
         self.is_cd = is_cd
         self.cd_source = None
-        self.playlist = []
-        self.current_track_index = 0
-        self.stream = None
-        self.audio_data_stereo = None
-        self.audio_data_mono = None
-        self.position = 0
-        self.is_playing = False
-        self.total_frames = 0
-        self.rip_queue = []
-        self.ripping_thread = None
-        self.stop_ripping = False
+        self.library = None
+        self.rip_cache = None
+        self.cd_backend = cd_backend
+        self.metadata_signals = MetadataSignals()
+        self.metadata_signals.tracks_ready.connect(self.apply_track_info)
+        self.playlist_model = PlaylistModel()
+        self.playlist = self.playlist_model.entries
+        self.folder_index = None
+        self.rip_scheduler = None
+        self.analyzer = None
+        self.engine = PlaybackEngine(self.get_track_source, self.playlist, crossfade_seconds=crossfade_seconds,
+                                     normalize=NORMALIZE, get_gain=self.track_gain_db)
+        self.output_rate = self.engine.output_rate
+        self.metrics_exporters = start_exporters()
 
         self.init_ui()
+        self.engine.on_block = self.visualizer.process_audio
 
         if is_cd:
             self.load_cd()
+        elif library:
+            self.load_library()
         else:
             self.load_playlist()
 
@@ -49,24 +71,30 @@ class MediaPlayerUI(QMainWindow):
 
         main_horizontal = QHBoxLayout(central_widget)
 
-        self.track_list = QListWidget()
+        self.track_list = QListView()
+        self.track_list.setModel(self.playlist_model)
+        self.track_list.setUniformItemSizes(True)
         self.track_list.setMaximumWidth(300)
-        self.track_list.itemDoubleClicked.connect(self.track_selected)
+        self.track_list.doubleClicked.connect(self.track_selected)
         main_horizontal.addWidget(self.track_list)
 
         player_widget = QWidget()
         main_layout = QVBoxLayout(player_widget)
         main_horizontal.addWidget(player_widget)
 
-        self.visualizer = AudioVisualizer(num_bars=20, smoothing=0.7)
+        self.visualizer = AudioVisualizer(num_bars=20, smoothing=0.7, sample_rate=self.output_rate)
         main_layout.addWidget(self.visualizer.win)
 
+        self.metrics_panel = MetricsPanel(self.visualizer.win)
+        self.metrics_shortcut = QShortcut(QKeySequence("F3"), self)
+        self.metrics_shortcut.activated.connect(self.metrics_panel.toggle)
+
         self.song_label = QLabel("No song loaded")
         self.song_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.song_label.setStyleSheet("font-size: 14pt; font-weight: bold;")
         main_layout.addWidget(self.song_label)
 
-        self.progress_bar = QSlider(Qt.Orientation.Horizontal)
+        self.progress_bar = WaveformSlider(Qt.Orientation.Horizontal)
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(1000)
         self.progress_bar.sliderMoved.connect(self.seek)
@@ -83,23 +111,28 @@ class MediaPlayerUI(QMainWindow):
         controls_layout = QHBoxLayout()
 
         self.prev_button = QPushButton("Previous")
-        self.prev_button.clicked.connect(self.previous_track)
+        self.prev_button.clicked.connect(self.engine.previous_track)
         controls_layout.addWidget(self.prev_button)
 
         self.play_button = QPushButton("Play")
-        self.play_button.clicked.connect(self.toggle_play_pause)
+        self.play_button.clicked.connect(self.engine.toggle_play_pause)
         controls_layout.addWidget(self.play_button)
 
         self.stop_button = QPushButton("Stop")
-        self.stop_button.clicked.connect(self.stop)
+        self.stop_button.clicked.connect(self.engine.stop)
         controls_layout.addWidget(self.stop_button)
 
         self.next_button = QPushButton("Next")
-        self.next_button.clicked.connect(self.next_track)
+        self.next_button.clicked.connect(self.engine.next_track)
         controls_layout.addWidget(self.next_button)
 
         controls_layout.addStretch()
 
+        self.normalize_checkbox = QCheckBox("Normalize")
+        self.normalize_checkbox.setChecked(self.engine.normalize)
+        self.normalize_checkbox.toggled.connect(self.engine.set_normalize)
+        controls_layout.addWidget(self.normalize_checkbox)
+
         volume_label = QLabel("Volume:")
         controls_layout.addWidget(volume_label)
         self.volume_slider = QSlider(Qt.Orientation.Horizontal)
@@ -107,6 +140,8 @@ class MediaPlayerUI(QMainWindow):
         self.volume_slider.setMaximum(100)
         self.volume_slider.setValue(50)
         self.volume_slider.setMaximumWidth(150)
+        self.volume_slider.valueChanged.connect(self.set_volume)
+        self.set_volume(self.volume_slider.value())
         controls_layout.addWidget(self.volume_slider)
 
         main_layout.addLayout(controls_layout)
@@ -117,180 +152,228 @@ class MediaPlayerUI(QMainWindow):
 
     def load_cd(self):
         from cd_audio_source import CDAudioSource
-
-        self.cd_source = CDAudioSource()
+        from cd_backends import default_backend
+        from rip_cache import RipCache
+        from metadata_cache import MetadataCache
+        from library import Library
+
+        cache = RipCache()
+        self.cd_source = CDAudioSource(
+            self.cd_backend or default_backend(),
+            cache,
+            MetadataCache(),
+            os.environ.get("MUSICBRAINZ_HOST")
+        )
 
         if not self.cd_source.detect_cd():
             print("No CD detected")
             return
+
+        self.start_analyzer(cache, [self.cd_source.disc.id])
         
-        tracks = self.cd_source.get_track_info()
+        tracks = self.cd_source.get_track_info_async(self.metadata_signals.tracks_ready.emit)
 
-        for track in tracks:
-            track_name = f"{track['number']:02d}. {track['title']}"
-            self.playlist.append(track)
-            self.track_list.addItem(track_name)
+        self.playlist_model.append_entries(tracks)
+        self.library = Library()
+        self.library.add_disc(self.cd_source.disc.id, self.cd_source.disc_info, tracks)
 
         self.setWindowTitle(f"CD Player - {self.cd_source.get_disc_info_string()}")
 
         print(f"Loaded {len(self.playlist)} tracks from CD")
 
-    def start_background_ripper(self):
-        self.rip_queue = list(range(2, len(self.playlist) + 1))
-        self.stop_ripping = False
+        if self.cd_source.backend:
+            return
+        self.rip_scheduler = RipScheduler(self.cd_source, range(1, len(self.playlist) + 1))
+        self.rip_scheduler.start()
+
+    def start_analyzer(self, cache, disc_ids):
+        from track_analysis import TrackAnalyzer
+
+        self.analysis_signals = AnalysisSignals()
+        self.analysis_signals.analysis_ready.connect(self.analysis_ready)
+        self.analyzer = TrackAnalyzer()
+        self.analyzer.on_done = self.analysis_signals.analysis_ready.emit
+        cache.on_commit = self.analyzer.submit
+        for disc_id in disc_ids:
+            self.analyzer.submit_cached(cache, disc_id)
+
+    def load_library(self):
+        from rip_cache import RipCache
+        from metadata_cache import MetadataCache
+        from library import Library
+
+        # every ripped disc and the local folder as one queue, played straight from the rip cache
+        self.rip_cache = RipCache()
+        self.library = Library()
+        self.library.sync_rip_cache(self.rip_cache, MetadataCache())
+        self.start_analyzer(self.rip_cache, self.rip_cache.disc_ids())
+
+        self.playlist_model.append_entries(self.library.queue(playable=self.is_playable))
+        self.setWindowTitle(f"Library - {len(self.library.albums())} albums")
+        print(f"Loaded {len(self.playlist)} tracks from the library")
+
+        if self.source_path and os.path.isdir(self.source_path):
+            self.load_playlist()
 
-        def ripper_worker():
-            while self.rip_queue and not self.stop_ripping:
-                track_num = self.rip_queue.pop(0)
-                print(f"Ripping track {track_num} in background...")
-                self.cd_source.rip_track_to_wav(track_num)
-        
-        self.ripping_thread = threading.Thread(target=ripper_worker, daemon=True)
-        self.ripping_thread.start()
-        print("\nBackground ripper started")
+    def is_playable(self, entry):
+        if 'disc_id' in entry:
+            return self.rip_cache.key(entry['disc_id'], entry['number']) in self.rip_cache.entries
+        return 'path' in entry
 
-    def load_playlist(self):
-        for filename in sorted(os.listdir(self.source_path)):
-            if filename.lower().endswith('.mp3'):
-                full_path = os.path.join(self.source_path, filename)
-                self.playlist.append(full_path)
-                self.track_list.addItem(filename)
-
-    def load_audio(self):
-        if not self.playlist:
-            print("No audio files found in the folder.")
-            return
+    def apply_track_info(self, tracks):
+        for i, track in enumerate(tracks[:len(self.playlist)]):
+            self.playlist[i]['title'] = track['title']
+            self.playlist_model.refresh_row(i)
+        if self.library:
+            self.library.add_disc(self.cd_source.disc.id, self.cd_source.disc_info, tracks)
 
+        self.setWindowTitle(f"CD Player - {self.cd_source.get_disc_info_string()}")
+        if self.engine.is_loaded:
+            self.show_current_track()
+        print("Track titles updated from MusicBrainz")
+
+    def track_disc(self, index):
+        entry = self.playlist[index]
+        if 'disc_id' in entry:
+            return entry['disc_id'], entry['number']
         if self.is_cd:
-            track_num = self.current_track_index + 1
-            print(f"Ripping track {track_num} (foreground)...")
-            wav_path = self.cd_source.rip_track_to_wav(track_num)
+            return self.cd_source.disc.id, index + 1
+        return None, None
 
-            if not wav_path:
-                print(f"Failed to rip track {track_num}.")
-                return
-            
-            current_file = wav_path
-            track_info = self.playlist[self.current_track_index]
-            self.song_label.setText(f"{track_num:02d}. {track_info['title']}")
+    def track_analysis(self, index):
+        if not self.analyzer:
+            return None
+        disc_id, track_number = self.track_disc(index)
+        return self.analyzer.store.get(disc_id, track_number) if disc_id else None
 
-            if not self.ripping_thread or not self.ripping_thread.is_alive():
-                self.start_background_ripper()
+    def track_gain_db(self, index):
+        analysis = self.track_analysis(index)
+        return analysis.gain_db if analysis else None
 
-        else:
-            current_file = self.playlist[self.current_track_index]
-            self.song_label.setText(os.path.basename(current_file))
-        
-        data, sr = sf.read(current_file, always_2d=True)
-        self.track_list.setCurrentRow(self.current_track_index)
+    def analysis_ready(self, disc_id, track_number):
+        # picks up the measured gain for the playing and queued tracks
+        self.engine.set_normalize(self.engine.normalize)
+        if self.engine.is_loaded and self.track_disc(self.engine.current_index) == (disc_id, track_number):
+            self.progress_bar.set_waveform(self.track_analysis(self.engine.current_index))
 
-        if data.shape[1] > 1:
-            self.audio_data_stereo = data
-            self.audio_data_mono = np.mean(data, axis=1)
+    def load_playlist(self):
+        self.folder_index = FolderIndex(self.source_path)
+        if self.library:
+            rows = self.playlist_model.merge_entries(self.library.add_folder_entries(self.folder_index.cached_entries()))
+            self.engine.rows_inserted(rows)
         else:
-            self.audio_data_stereo = np.column_stack([data, data])
-            self.audio_data_mono = data.flatten()
+            self.playlist_model.append_entries(self.folder_index.cached_entries())
+
+        self.index_signals = IndexSignals()
+        self.index_signals.chunk_ready.connect(self.add_indexed_tracks)
+        self.index_signals.scan_done.connect(self.remove_indexed_tracks)
+        self.folder_index.scan_async(self.index_signals.chunk_ready.emit, self.index_signals.scan_done.emit)
+
+    def add_indexed_tracks(self, chunk):
+        entries = [entry for entry, _ in chunk]
+        if self.library:
+            entries = self.library.add_folder_entries(entries)
+        self.engine.rows_inserted(self.playlist_model.merge_entries(entries))
+        if not self.engine.is_loaded:
+            self.load_audio()
+
+    def remove_indexed_tracks(self, paths):
+        if self.library:
+            self.library.remove_paths(paths)
+        self.engine.rows_removed(self.playlist_model.remove_paths(paths))
+
+    def get_track_source(self, index, foreground=True):
+        entry = self.playlist[index]
+        if 'disc_id' in entry:
+            path = self.rip_cache.get(entry['disc_id'], entry['number'])
+            if not path:
+                print(f"{entry['album']} track {entry['number']} is no longer in the rip cache")
+            return path
+
+        if not self.is_cd:
+            return self.playlist[index]['path']
+
+        track_num = index + 1
+        if self.cd_source.backend:
+            return self.cd_source.get_cached_track(track_num) or self.cd_source.open_track(track_num)
+
+        self.rip_scheduler.request(track_num, PRIORITY_PLAYING if foreground else PRIORITY_NEXT)
+        if self.rip_scheduler.get_state(track_num) == DONE:
+            return self.rip_scheduler.wait_for(track_num)
+
+        # a preempted rip goes back to the queue, so only DONE or FAILED ends the file
+        source = GrowingWavSource(
+            self.cd_source.get_output_path(track_num),
+            lambda: self.rip_scheduler.get_state(track_num) in (DONE, FAILED),
+            self.playlist[index].get('frames', 0),
+            final_path=lambda: self.rip_scheduler.paths.get(track_num)
+        )
+        if foreground:
+            # this runs on the GUI thread; the decoder's pending path waits for the rip instead
+            print(f"Playing track {track_num} while it rips")
+            return source
+
+        if self.rip_scheduler.wait_for_start(track_num) == RIPPING and source.wait_ready():
+            print(f"Playing track {track_num} while it rips")
+            return source
+        source.close()
+
+        wav_path = self.rip_scheduler.wait_for(track_num)
+
+        if not wav_path:
+            print(f"Failed to rip track {track_num}.")
+        return wav_path
 
-        self.total_frames = len(self.audio_data_mono)
-        total_seconds = self.total_frames / SAMPLE_RATE
-        self.total_time_label.setText(self.format_time(total_seconds))
-
-    def audio_callback(self, outdata, frames, time, status):
-        if status:
-            print(status)
-        
-        chunk_stereo = self.audio_data_stereo[self.position:self.position + frames]
-        chunk_mono = self.audio_data_mono[self.position:self.position + frames]
+    def load_audio(self):
+        self.engine.load()
 
-        if len(chunk_stereo) < frames:
-            chunk_stereo = np.pad(chunk_stereo, ((0, frames - len(chunk_stereo)), (0, 0)))
-            chunk_mono = np.pad(chunk_mono, (0, frames - len(chunk_mono)))
-            self.next_track()
+    def show_current_track(self):
+        index = self.engine.current_index
+        if self.is_cd:
+            track_info = self.playlist[index]
+            self.song_label.setText(f"{index + 1:02d}. {track_info['title']}")
+        elif self.library:
+            track_info = self.playlist[index]
+            self.song_label.setText(f"{track_info['album']} - {track_info['title']}")
         else:
-            self.position += frames
+            self.song_label.setText(self.playlist[index]['title'])
 
-        volume = self.volume_slider.value() / 100.0
-        chunk_stereo *= volume
+        self.track_list.setCurrentIndex(self.playlist_model.index(index))
+        self.progress_bar.set_waveform(self.track_analysis(index))
 
-        outdata[:] = chunk_stereo
-        self.visualizer.process_audio(chunk_mono)
-    
-    def previous_track(self):
-        was_playing = self.is_playing
-        self.stop()
-
-        self.current_track_index -= 1
-        if self.current_track_index < 0:
-            self.current_track_index = len(self.playlist) - 1
-
-        self.load_audio()
-        if was_playing:
-            self.play()
+        total_seconds = self.engine.total_frames / self.output_rate
+        self.total_time_label.setText(self.format_time(total_seconds))
 
-    def toggle_play_pause(self):
-        if self.is_playing:
-            self.pause()
-        else:
-            self.play()
+    def set_volume(self, value):
+        self.engine.set_volume(value / 100.0)
     
-    def play(self):
-        if not self.stream:
-            self.stream = sd.OutputStream(
-                callback=self.audio_callback,
-                channels=2,
-                samplerate=SAMPLE_RATE,
-                blocksize=CHUNK_SIZE
-            )
-        self.stream.start()
-        self.is_playing = True
-        self.play_button.setText("Pause")
-    
-    def pause(self):
-        if self.stream:
-            self.stream.stop()
-        self.is_playing = False
-        self.play_button.setText("Play")
-    
-    def stop(self):
-        if self.stream:
-            self.stream.stop()
-        self.position = 0
-        self.is_playing = False
-        self.play_button.setText("Play")
-        self.visualizer.bar_heights = np.zeros(self.visualizer.num_bars)
-
-    def next_track(self):
-        was_playing = self.is_playing
-        self.stop()
-
-        self.current_track_index += 1
-        if self.current_track_index >= len(self.playlist):
-            self.current_track_index = 0
-
-        self.load_audio()
-        if was_playing:
-            self.play()
-
-    def track_selected(self, item):
-        was_playing = self.is_playing
-        self.stop()
-
-        self.current_track_index = self.track_list.currentRow()
-
-        self.load_audio()
-        if was_playing:
-            self.play()
+    def track_selected(self, index):
+        self.engine.select(index.row())
 
     def seek(self, value):
-        self.position = int((value / 1000) * self.total_frames)
+        self.engine.seek((value / 1000) * self.engine.total_frames)
 
     def update_progress(self):
-        if self.total_frames > 0:
-            progress = int((self.position / self.total_frames) * 1000)
-            self.progress_bar.setValue(progress)
-
-            current_seconds = self.position / SAMPLE_RATE
-            self.current_time_label.setText(self.format_time(current_seconds))
+        for event, value in self.engine.poll_events():
+            if event == TRACK_CHANGED:
+                self.show_current_track()
+            elif event == STATE_CHANGED:
+                self.play_button.setText("Pause" if value == PLAYING else "Play")
+                if value == STOPPED:
+                    self.visualizer.reset()
+            elif event == OUTPUT_STATUS:
+                print(value)
+
+        total_frames = self.engine.total_frames
+        if total_frames > 0:
+            position = self.engine.position
+            progress = int((position / total_frames) * 1000)
+            if progress != self.progress_bar.value() and not self.progress_bar.isSliderDown():
+                self.progress_bar.setValue(progress)
+
+            current_time = self.format_time(position / self.output_rate)
+            if current_time != self.current_time_label.text():
+                self.current_time_label.setText(current_time)
 
     def format_time(self, seconds):
         minutes = int(seconds // 60)
@@ -303,24 +386,28 @@ class MediaPlayerUI(QMainWindow):
         if hasattr(self, 'ui_timer'):
             self.ui_timer.stop()
         
-        self.stop_ripping = True
+        if self.folder_index:
+            self.folder_index.stop()
 
-        if self.is_cd and self.cd_source:
-            self.cd_source.stop_current_rip()
-
-        if self.ripping_thread and self.ripping_thread.is_alive():
-            print("Waiting for background ripper to stop...")
-            self.ripping_thread.join(timeout=2)
-
-        if self.stream:
-            try:
-                self.stream.stop()
-                self.stream.close()
-            except Exception as e:
-                print(f"Error stopping stream: {e}")
-        
-        self.audio_data_stereo = None
-        self.audio_data_mono = None
+        if self.rip_scheduler:
+            self.rip_scheduler.stop()
+
+        if self.cd_source and self.cd_source.cache:
+            self.cd_source.cache.close()
+
+        if self.analyzer:
+            self.analyzer.close()
+
+        if self.rip_cache:
+            self.rip_cache.close()
+
+        if self.library:
+            self.library.close()
+
+        self.engine.close()
+
+        for exporter in self.metrics_exporters:
+            exporter.stop()
         
         import time
         time.sleep(0.1)
@@ -336,6 +423,17 @@ if __name__ == "__main__":
 
     if len(sys.argv) > 1 and sys.argv[1] == "--cd":
         player = MediaPlayerUI(is_cd=True)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--live":
+        from live_input import LiveCapture, LiveAnalyzerWindow
+        capture = LiveCapture(sys.argv[2:])
+        if not capture.streams:
+            sys.exit("No input streams could be opened")
+        player = LiveAnalyzerWindow(capture)
+    elif len(sys.argv) > 1 and sys.argv[1] == "--library":
+        player = MediaPlayerUI(sys.argv[2] if len(sys.argv) > 2 else None, library=True)
+    elif len(sys.argv) > 2 and sys.argv[1] == "--cd-image":
+        from cd_backends import ImageFileBackend
+        player = MediaPlayerUI(is_cd=True, cd_backend=ImageFileBackend(sys.argv[2]))
     else:
         player = MediaPlayerUI("test_audios")
 
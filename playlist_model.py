@@ -0,0 +1,83 @@
+from bisect import bisect_right
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+
+class PlaylistModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = []
+        self.rows_by_path = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.label(self.entries[index.row()])
+
+    def label(self, entry):
+        if 'number' in entry:
+            return f"{entry['number']:02d}. {entry['title']}"
+        duration = entry.get('duration')
+        if duration is None:
+            return entry['title']
+        return f"{entry['title']} ({int(duration // 60)}:{int(duration % 60):02d})"
+
+    def append_entries(self, entries):
+        if not entries:
+            return
+        start = len(self.entries)
+        self.beginInsertRows(QModelIndex(), start, start + len(entries) - 1)
+        for entry in entries:
+            if 'path' in entry:
+                self.rows_by_path[entry['path']] = len(self.entries)
+            self.entries.append(entry)
+        self.endInsertRows()
+
+    def merge_entries(self, entries):
+        # returns the rows the new files were inserted at, in the merged playlist
+        new_entries = {}
+        for entry in entries:
+            row = self.rows_by_path.get(entry.get('path'))
+            if row is None:
+                new_entries[entry['path']] = entry
+            else:
+                self.entries[row] = entry
+                self.refresh_row(row)
+        if not new_entries:
+            return []
+
+        # files the scan finds go where the path-sorted cached index would have them
+        paths = [entry.get('path', '') for entry in self.entries]
+        groups = {}
+        for path in sorted(new_entries):
+            groups.setdefault(bisect_right(paths, path), []).append(new_entries[path])
+        rows = []
+        shift = len(new_entries)
+        for row in sorted(groups, reverse=True):
+            group = groups[row]
+            shift -= len(group)
+            self.beginInsertRows(QModelIndex(), row, row + len(group) - 1)
+            self.entries[row:row] = group
+            self.endInsertRows()
+            rows[:0] = range(row + shift, row + shift + len(group))
+        self._index_rows()
+        return rows
+
+    def remove_paths(self, paths):
+        # returns the removed rows as they were numbered before the removal
+        rows = sorted({self.rows_by_path[path] for path in paths if path in self.rows_by_path})
+        for row in reversed(rows):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.entries[row]
+            self.endRemoveRows()
+        if rows:
+            self._index_rows()
+        return rows
+
+    def refresh_row(self, row):
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def _index_rows(self):
+        self.rows_by_path = {entry['path']: i for i, entry in enumerate(self.entries) if 'path' in entry}
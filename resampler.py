@@ -0,0 +1,80 @@
+from math import gcd, ceil
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+TAPS_PER_PHASE = 32
+KAISER_BETA = 8.6
+
+def downmix_matrix(channels):
+    if channels == 1:
+        return np.array([[1.0, 1.0]], dtype=np.float32)
+    if channels == 2:
+        return np.eye(2, dtype=np.float32)
+
+    matrix = np.zeros((channels, 2), dtype=np.float32)
+    if channels == 6:
+        # 5.1 in WAV/FLAC order: L R C LFE Ls Rs, ITU-R BS.775 style without the LFE
+        matrix[0, 0] = matrix[1, 1] = 1.0
+        matrix[2, :] = 0.7071
+        matrix[4, 0] = matrix[5, 1] = 0.7071
+    else:
+        matrix[0::2, 0] = 1.0
+        matrix[1::2, 1] = 1.0
+    return matrix / matrix.sum(axis=0).max()
+
+def downmix(block):
+    if block.shape[1] == 2:
+        return block
+    return block @ downmix_matrix(block.shape[1])
+
+class StreamingResampler:
+    def __init__(self, input_rate, output_rate, channels=2, taps=TAPS_PER_PHASE):
+        divisor = gcd(int(input_rate), int(output_rate))
+        self.up = int(output_rate) // divisor
+        self.down = int(input_rate) // divisor
+        self.channels = channels
+        self.taps = taps
+
+        length = self.up * taps
+        cutoff = 0.95 / max(self.up, self.down)
+        # centre the filter on a whole output sample so the delay can be dropped exactly
+        center = self.down * round((length - 1) / 2 / self.down)
+        n = np.arange(length) - center
+        window = np.i0(KAISER_BETA * np.sqrt(np.clip(1 - (2 * n / length) ** 2, 0, 1))) / np.i0(KAISER_BETA)
+        prototype = cutoff * np.sinc(cutoff * n) * window * self.up
+        self.phases = prototype.reshape(taps, self.up).T[:, ::-1].astype(np.float32)
+
+        self.delay_out = center // self.down
+        self.flush_frames = int(ceil(center / self.up)) + 1
+        self.reset()
+
+    def reset(self):
+        self.history = np.zeros((self.taps - 1, self.channels), dtype=np.float32)
+        self.input_count = 0
+        self.output_count = 0
+        self.skip = self.delay_out
+
+    def process(self, block):
+        frames = len(block)
+        buffer = np.concatenate((self.history, block.astype(np.float32, copy=False)))
+        input_end = self.input_count + frames
+        output_end = (input_end * self.up + self.down - 1) // self.down
+
+        k = np.arange(self.output_count, output_end, dtype=np.int64)
+        positions = k * self.down
+        bases = positions // self.up - self.input_count
+        windows = sliding_window_view(buffer, self.taps, axis=0)
+        out = np.matmul(windows[bases], self.phases[positions % self.up][:, :, None])[:, :, 0]
+
+        self.history = buffer[len(buffer) - (self.taps - 1):]
+        self.input_count = input_end
+        self.output_count = output_end
+
+        if self.skip:
+            dropped = min(self.skip, len(out))
+            self.skip -= dropped
+            out = out[dropped:]
+        return out
+
+    def flush(self):
+        return self.process(np.zeros((self.flush_frames, self.channels), dtype=np.float32))
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import soundfile as sf
+from app_paths import get_cache_dir
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+ENCODE_BLOCK_FRAMES = 1 << 16
+ENCODER_WORKERS = 2
+STALE_FILE_AGE = 60
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def encode_flac(wav_path, flac_path):
+    source_digest = hashlib.sha256()
+    with sf.SoundFile(wav_path) as source:
+        with sf.SoundFile(flac_path, 'w', source.samplerate, source.channels, 'PCM_16', format='FLAC') as target:
+            for block in source.blocks(ENCODE_BLOCK_FRAMES, dtype='int16'):
+                source_digest.update(block.tobytes())
+                target.write(block)
+
+    decoded_digest = hashlib.sha256()
+    with sf.SoundFile(flac_path) as decoded:
+        for block in decoded.blocks(ENCODE_BLOCK_FRAMES, dtype='int16'):
+            decoded_digest.update(block.tobytes())
+
+    if decoded_digest.digest() != source_digest.digest():
+        os.remove(flac_path)
+        raise ValueError(f"FLAC encode of {wav_path} is not bit-exact")
+    return flac_path
+
+class RipCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, compress=True):
+        self.root = root or get_cache_dir("rips")
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.encoder_pool = None
+        self.index_path = os.path.join(self.root, "index.json")
+        self.entries = {}
+        self.verified = set()
+        self.lock = threading.Lock()
+        self.on_commit = None
+        self.stale_files = set()
+        self._load_index()
+        self._sweep_stale_files()
+
+    def key(self, disc_id, track_number):
+        return f"{disc_id}/{track_number:02d}"
+
+    def get(self, disc_id, track_number):
+        key = self.key(disc_id, track_number)
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            path = os.path.join(self.root, entry['file'])
+
+            if key not in self.verified:
+                if not self._verify(path, entry):
+                    print(f"Cache entry {key} failed verification, dropping it")
+                    self._remove(key)
+                    self._save_index()
+                    return None
+                self.verified.add(key)
+
+            entry['last_used'] = time.time()
+            self._save_index()
+            return path
+
+    def cached_tracks(self, disc_id):
+        # unverified paths, for background work that can tolerate a stale entry
+        prefix = disc_id + "/"
+        with self.lock:
+            return {int(key[len(prefix):]): os.path.join(self.root, entry['file'])
+                    for key, entry in self.entries.items() if key.startswith(prefix)}
+
+    def disc_ids(self):
+        with self.lock:
+            return sorted({key.split('/')[0] for key in self.entries})
+
+    def partial_path(self, disc_id, track_number, extension="wav"):
+        disc_dir = os.path.join(self.root, disc_id)
+        os.makedirs(disc_dir, exist_ok=True)
+        return os.path.join(disc_dir, f"track_{track_number:02d}.partial.{extension}")
+
+    def commit(self, disc_id, track_number, partial_path, extension="wav", checksum=None):
+        key = self.key(disc_id, track_number)
+        relative = os.path.join(disc_id, f"track_{track_number:02d}.{extension}")
+        final_path = os.path.join(self.root, relative)
+        checksum = checksum or file_sha256(partial_path)
+
+        try:
+            os.replace(partial_path, final_path)
+        except PermissionError:
+            # the file is still open for playback (Windows), so copy instead of renaming
+            staging = final_path + ".tmp"
+            shutil.copyfile(partial_path, staging)
+            os.replace(staging, final_path)
+            # the partial can only go once the player closes it
+            with self.lock:
+                self.stale_files.add(partial_path)
+
+        with self.lock:
+            old = self.entries.get(key)
+            if old and old['file'] != relative:
+                self._remove(key)
+            self.entries[key] = {
+                'file': relative,
+                'size': os.path.getsize(final_path),
+                'sha256': checksum,
+                'last_used': time.time(),
+            }
+            self.verified.add(key)
+            self._evict(keep=key)
+            self._save_index()
+        self._remove_stale_files()
+
+        if self.compress and extension == "wav":
+            self._schedule_flac(disc_id, track_number, final_path)
+        elif self.on_commit:
+            self.on_commit(disc_id, track_number, final_path)
+        return final_path
+
+    def close(self):
+        if self.encoder_pool:
+            self.encoder_pool.shutdown(wait=False, cancel_futures=True)
+            self.encoder_pool = None
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        with self.lock:
+            cached = {os.path.join(self.root, entry['file']) for entry in self.entries.values()}
+            for path in list(self.stale_files):
+                # a track committed again since then owns the path now
+                if path not in cached:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError:
+                        continue
+                self.stale_files.discard(path)
+
+    def _sweep_stale_files(self):
+        # files a previous session could not delete while they were open: WAVs replaced by their FLAC,
+        # evicted tracks, and ripped WAVs of tracks already in the cache left behind by a copy fallback.
+        # Partial FLACs are skipped, another process may still be encoding one
+        cached = {entry['file'] for entry in self.entries.values()}
+        # a file younger than that may be a commit of another process that has not saved the index yet
+        settled = time.time() - STALE_FILE_AGE
+        for disc_id in os.listdir(self.root):
+            disc_dir = os.path.join(self.root, disc_id)
+            if not os.path.isdir(disc_dir):
+                continue
+            for name in os.listdir(disc_dir):
+                relative = os.path.join(disc_id, name)
+                partial = name.endswith(".partial.wav") and f"{disc_id}/{name[6:8]}" in self.entries
+                track = name.startswith("track_") and name.endswith((".wav", ".flac")) and ".partial." not in name
+                path = os.path.join(self.root, relative)
+                if (partial or (track and relative not in cached)) and os.path.getmtime(path) < settled:
+                    self.stale_files.add(path)
+        self._remove_stale_files()
+
+    def _schedule_flac(self, disc_id, track_number, wav_path):
+        if not self.encoder_pool:
+            self.encoder_pool = ProcessPoolExecutor(max_workers=ENCODER_WORKERS)
+
+        flac_path = self.partial_path(disc_id, track_number, "flac")
+        future = self.encoder_pool.submit(encode_flac, wav_path, flac_path)
+
+        def encoded(done):
+            if done.cancelled():
+                return
+            try:
+                done.result()
+            except Exception as e:
+                print(f"FLAC encode of {disc_id} track {track_number} failed: {e}")
+                return
+            self.commit(disc_id, track_number, flac_path, "flac")
+            print(f"Compressed {disc_id} track {track_number} to FLAC")
+
+        future.add_done_callback(encoded)
+
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def _verify(self, path, entry):
+        try:
+            if os.path.getsize(path) != entry['size']:
+                return False
+            return file_sha256(path) == entry['sha256']
+        except OSError:
+            return False
+
+    def _evict(self, keep=None):
+        total = self.total_bytes()
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self.entries[key]['size']
+            print(f"Evicting {key} from rip cache")
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        self.verified.discard(key)
+        if entry:
+            path = os.path.join(self.root, entry['file'])
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # still open for playback (Windows); retried on the next commit, on close and at startup
+                print(f"Could not remove {path} from rip cache: {e}")
+                self.stale_files.add(path)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _save_index(self):
+        staging = self.index_path + ".tmp"
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(staging, self.index_path)
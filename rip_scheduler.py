@@ -0,0 +1,129 @@
+import heapq
+import threading
+from metrics import REGISTRY
+
+QUEUED = "queued"
+RIPPING = "ripping"
+DONE = "done"
+FAILED = "failed"
+
+PRIORITY_PLAYING = 0
+PRIORITY_NEXT = 1
+PRIORITY_BACKGROUND = 2
+
+class RipScheduler:
+    def __init__(self, cd_source, track_numbers):
+        self.cd_source = cd_source
+        self.states = {}
+        self.paths = {}
+        self.priorities = {}
+        self.current_track = None
+        self.preempted_track = None
+        self._heap = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread = None
+
+        for track_num in track_numbers:
+            self.states[track_num] = QUEUED
+            self._push(track_num, PRIORITY_BACKGROUND)
+
+        REGISTRY.gauge("rip_queue_depth", "Tracks still waiting to be ripped", fn=self.queue_depth)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        print("\nBackground ripper started")
+
+    def get_state(self, track_num):
+        return self.states.get(track_num)
+
+    def queue_depth(self):
+        return sum(1 for state in self.states.values() if state == QUEUED)
+
+    def request(self, track_num, priority=PRIORITY_PLAYING):
+        with self._cond:
+            if track_num not in self.states:
+                return
+            if self.states[track_num] == FAILED:
+                self.states[track_num] = QUEUED
+                self._push(track_num, priority)
+                self._cond.notify_all()
+            elif self.states[track_num] == QUEUED and priority < self.priorities[track_num]:
+                self._push(track_num, priority)
+                self._cond.notify_all()
+
+            current = self.current_track
+            if (priority == PRIORITY_PLAYING and current is not None and current != track_num
+                    and self.states[track_num] == QUEUED and self.priorities[current] > priority):
+                # still under the lock, so the worker cannot have moved on to another track
+                print(f"Preempting rip of track {current} for track {track_num}")
+                self.preempted_track = current
+                self.cd_source.stop_current_rip(current)
+
+    def wait_for(self, track_num, timeout=None):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stop or self.states.get(track_num) in (DONE, FAILED, None),
+                timeout
+            )
+            return self.paths.get(track_num)
+
+    def wait_for_start(self, track_num, timeout=None):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._stop or self.states.get(track_num) != QUEUED,
+                timeout
+            )
+            return self.states.get(track_num)
+
+    def stop(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self.cd_source.stop_current_rip()
+        if self._thread and self._thread.is_alive():
+            print("Waiting for background ripper to stop...")
+            self._thread.join(timeout=2)
+
+    def _push(self, track_num, priority):
+        self.priorities[track_num] = priority
+        heapq.heappush(self._heap, (priority, track_num))
+
+    def _pop(self):
+        while self._heap:
+            priority, track_num = heapq.heappop(self._heap)
+            if self.states[track_num] == QUEUED and self.priorities[track_num] == priority:
+                return track_num
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                track_num = self._pop()
+                while track_num is None and not self._stop:
+                    self._cond.wait()
+                    track_num = self._pop()
+                if self._stop:
+                    return
+                self.states[track_num] = RIPPING
+                self.current_track = track_num
+                self._cond.notify_all()
+
+            print(f"Ripping track {track_num} (priority {self.priorities[track_num]})...")
+            path = self.cd_source.rip_track_to_wav(track_num)
+
+            with self._cond:
+                self.current_track = None
+                preempted = self.preempted_track == track_num
+                if preempted:
+                    self.preempted_track = None
+                if preempted and not path:
+                    self.states[track_num] = QUEUED
+                    self._push(track_num, self.priorities[track_num])
+                elif path:
+                    self.paths[track_num] = path
+                    self.states[track_num] = DONE
+                else:
+                    self.states[track_num] = FAILED
+                self._cond.notify_all()
@@ -0,0 +1,327 @@
+import hashlib
+import mmap
+import os
+import threading
+import numpy as np
+import soundfile as sf
+from app_paths import get_cache_dir
+
+try:
+    # private to soundfile (see read_frames), so a release that drops them falls back to SoundFile.read
+    from soundfile import _snd, _ffi
+except ImportError:
+    _snd = _ffi = None
+
+INDEX_VERSION = 2
+FRAME_STRIDE = 8
+# decoding from a mid-stream frame gives silence until the bit reservoir (up to 511 bytes back) and the
+# overlap from the previous granule are filled, so start at least this far back and discard
+WARMUP_BYTES = 2048
+WARMUP_FRAMES = 4
+DECODER_DELAY = 529
+SYNC_SEARCH_BYTES = 1 << 16
+XING_BITRATE_INDEX = 9
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+GAPLESS_ENCODERS = (b'LAME', b'Lavf', b'Lavc')
+
+def parse_mp3_header(data, pos):
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 3
+    layer = (data[pos + 1] >> 1) & 3
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 3
+    padding = (data[pos + 2] >> 1) & 1
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    samplerate = MP3_SAMPLE_RATES[version][rate_index]
+    samples = 1152 if mpeg1 else 576
+    return samples * bitrate // 8 // samplerate + padding, samples
+
+def find_first_frame(data):
+    pos = 0
+    if data[:3] == b'ID3':
+        size = data[6:10]
+        pos = 10 + ((size[0] << 21) | (size[1] << 14) | (size[2] << 7) | size[3])
+        if data[5] & 0x10:
+            pos += 10
+
+    end = min(len(data), pos + SYNC_SEARCH_BYTES)
+    while pos < end:
+        header = parse_mp3_header(data, pos)
+        if header and parse_mp3_header(data, pos + header[0]):
+            return pos
+        pos = data.find(b'\xff', pos + 1, end)
+        if pos < 0:
+            break
+    return None
+
+def read_gapless_info(data, pos, length):
+    frame = data[pos:pos + length]
+    tag = max(frame.find(b'Xing'), frame.find(b'Info'))
+    if tag < 0:
+        return False, 0, 0
+
+    flags = int.from_bytes(frame[tag + 4:tag + 8], 'big')
+    ext = tag + 8 + 4 * bool(flags & 1) + 4 * bool(flags & 2) + 100 * bool(flags & 4) + 4 * bool(flags & 8)
+    if frame[ext:ext + 4] not in GAPLESS_ENCODERS or len(frame) < ext + 24:
+        return True, 0, 0
+    delay = (frame[ext + 21] << 4) | (frame[ext + 22] >> 4)
+    padding = ((frame[ext + 22] & 0x0F) << 8) | frame[ext + 23]
+    return True, delay, padding
+
+class Mp3SeekIndex:
+    def __init__(self, offsets, samples_per_frame, frame_count, skip, trim, gapless):
+        self.offsets = offsets
+        self.samples_per_frame = samples_per_frame
+        self.frame_count = frame_count
+        self.skip = skip
+        self.trim = trim
+        self.gapless = bool(gapless)
+        self.total_frames = frame_count * samples_per_frame - trim
+
+    def locate(self, frame):
+        # output frame 0 is raw decoder sample `skip`; decoding behind an info frame starts at DECODER_DELAY
+        target = (frame + self.skip) // self.samples_per_frame
+        entry = max(0, min(target // FRAME_STRIDE, len(self.offsets) - 1))
+        limit = int(self.offsets[entry]) - WARMUP_BYTES
+        entry = min(entry, (target - WARMUP_FRAMES) // FRAME_STRIDE)
+        if limit < int(self.offsets[0]) or entry <= 0:
+            return 0, 0
+        entry = min(entry, int(np.searchsorted(self.offsets, limit, side='right')) - 1)
+        first = entry * FRAME_STRIDE
+        if first <= 0:
+            return 0, 0
+        return first, first * self.samples_per_frame + DECODER_DELAY - self.skip
+
+def build_seek_index(path):
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
+
+    try:
+        pos = find_first_frame(data)
+        if pos is None:
+            return None
+
+        length, samples_per_frame = parse_mp3_header(data, pos)
+        info_frame, delay, padding = read_gapless_info(data, pos, length)
+        gapless = bool(delay or padding)
+        if info_frame:
+            pos += length
+
+        offsets = []
+        count = 0
+        while True:
+            header = parse_mp3_header(data, pos)
+            if not header:
+                break
+            if count % FRAME_STRIDE == 0:
+                offsets.append(pos)
+            count += 1
+            pos += header[0]
+    finally:
+        data.close()
+
+    if not offsets:
+        return None
+    if gapless:
+        skip, trim = delay + DECODER_DELAY, delay + padding
+    else:
+        # a plain decode keeps the decoder delay, and so does the indexed timeline
+        skip, trim = 0, 0
+    return Mp3SeekIndex(np.array(offsets, dtype=np.uint64), samples_per_frame, count, skip, trim, gapless)
+
+def seek_index_path(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return os.path.join(get_cache_dir("index", "seek"), f"{digest}.v{INDEX_VERSION}.npz")
+
+def file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_seek_index(path):
+    try:
+        with np.load(seek_index_path(path)) as saved:
+            meta = saved['meta'].tolist()
+            if meta[:2] != file_signature(path):
+                return None
+            return Mp3SeekIndex(saved['offsets'], *meta[2:])
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_seek_index(path, index):
+    index_path = seek_index_path(path)
+    staging = index_path + ".partial.npz"
+    meta = [index.samples_per_frame, index.frame_count, index.skip, index.trim, index.gapless]
+    meta = np.array(file_signature(path) + meta, dtype=np.int64)
+    try:
+        np.savez(staging, offsets=index.offsets, meta=meta)
+        os.replace(staging, index_path)
+    except OSError as e:
+        print(f"Could not save seek index for {path}: {e}")
+
+def get_seek_index(path):
+    index = load_seek_index(path)
+    if index is None:
+        index = build_seek_index(path)
+        if index is not None:
+            save_seek_index(path, index)
+    return index
+
+def xing_frame(header, frame_count):
+    # an info frame carrying the exact frame count, so libsndfile does not guess the length
+    # from the file size (and stop decoding early) when it starts mid-stream
+    header = bytes([header[0], header[1] | 1, (XING_BITRATE_INDEX << 4) | (header[2] & 0x0F), header[3]])
+    length, _ = parse_mp3_header(header, 0)
+    mpeg1 = (header[1] >> 3) & 3 == 3
+    mono = header[3] >> 6 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+
+    frame = bytearray(length)
+    frame[:4] = header
+    tag = 4 + side_info
+    frame[tag:tag + 12] = b'Xing' + (1).to_bytes(4, 'big') + frame_count.to_bytes(4, 'big')
+    return bytes(frame)
+
+READ_TYPES = {'float32': 'float', 'float64': 'double', 'int32': 'int', 'int16': 'short'}
+
+def read_frames(file, frames, dtype='float32', always_2d=True):
+    # SoundFile.read seeks back to its own idea of the position after every read, and on MP3 that
+    # seek makes libmpg123 resync and drop audio, so read through libsndfile directly
+    out = np.empty((max(0, frames), file.channels), dtype=dtype)
+    ctype = READ_TYPES[out.dtype.name]
+    readf = getattr(_snd, f"sf_readf_{ctype}", None)
+    handle = getattr(file, '_file', None)
+    if readf is None or handle is None:
+        # correct everywhere but on MP3, where the resync can drop a few frames after each read
+        out = file.read(out=out)
+    else:
+        read = readf(handle, _ffi.cast(f"{ctype} *", out.ctypes.data), len(out))
+        out = out[:max(0, read)]
+    return out if always_2d or file.channels > 1 else out[:, 0]
+
+class Mp3RangeFile:
+    def __init__(self, path, start, prefix=b''):
+        self.file = open(path, 'rb')
+        self.start = start
+        self.prefix = prefix
+        self.length = len(prefix) + max(0, os.fstat(self.file.fileno()).st_size - start)
+        self.position = 0
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self.position = max(0, min(offset, self.length))
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        count = 0
+        if self.position < len(self.prefix):
+            count = min(len(view), len(self.prefix) - self.position)
+            view[:count] = self.prefix[self.position:self.position + count]
+            self.position += count
+        if count < len(view) and self.position < self.length:
+            self.file.seek(self.start + self.position - len(self.prefix))
+            read = self.file.readinto(view[count:])
+            self.position += read
+            count += read
+        return count
+
+    def close(self):
+        self.file.close()
+
+class IndexedMp3Source:
+    def __init__(self, path):
+        self.path = path
+        self.file = sf.SoundFile(path)
+        self.samplerate = self.file.samplerate
+        self.channels = self.file.channels
+        self.range_file = None
+        self.position = 0
+        self.lock = threading.Lock()
+
+        self.index = load_seek_index(path)
+        if self.index:
+            self.frames = self.index.total_frames
+        else:
+            self.frames = self.file.frames
+            threading.Thread(target=self._build_index, daemon=True).start()
+
+    def seek(self, frame):
+        with self.lock:
+            frame = max(0, min(frame, self.frames))
+            index = self.index
+            if index is None:
+                self.position = self.file.seek(frame)
+                return self.position
+
+            first, start = index.locate(frame)
+            self._open_at(first)
+
+            skip = frame - start
+            while skip > 0:
+                dropped = len(read_frames(self.file, min(skip, 1 << 16)))
+                if not dropped:
+                    break
+                skip -= dropped
+            self.position = frame
+            return frame
+
+    def read(self, frames, dtype='float32', always_2d=True):
+        with self.lock:
+            if self.index:
+                # decoding from a byte offset does not trim the encoder padding at the end
+                frames = max(0, min(frames, self.index.total_frames - self.position))
+            block = read_frames(self.file, frames, dtype, always_2d)
+            self.position += len(block)
+            return block
+
+    def close(self):
+        with self.lock:
+            self._close_file()
+
+    def _open_at(self, first):
+        self._close_file()
+        if first == 0:
+            # the file's own start is exact already, with or without gapless info
+            self.file = sf.SoundFile(self.path)
+            return
+
+        offset = int(self.index.offsets[first // FRAME_STRIDE])
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            header = f.read(4)
+        prefix = xing_frame(header, self.index.frame_count - first)
+        self.range_file = Mp3RangeFile(self.path, offset, prefix)
+        self.file = sf.SoundFile(self.range_file)
+
+    def _close_file(self):
+        self.file.close()
+        if self.range_file:
+            self.range_file.close()
+            self.range_file = None
+
+    def _build_index(self):
+        index = get_seek_index(self.path)
+        if index is None:
+            return
+        # the indexed timeline is the plain decode's, so it can take over between two reads
+        with self.lock:
+            self.index = index
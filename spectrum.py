@@ -0,0 +1,62 @@
+from functools import lru_cache
+import numpy as np
+
+class BandMapper:
+    def __init__(self, fft_size, num_bars, sample_rate=44100, window='hann'):
+        self.fft_size = fft_size
+        self.num_bars = num_bars
+        self.sample_rate = sample_rate
+        self.freq_bins = fft_size // 2 + 1
+
+        edges = np.logspace(np.log10(2), np.log10(self.freq_bins), num_bars, dtype=int)
+        edges = np.concatenate(([0], edges))
+        # same repair as "edges[i] = max(edges[i], edges[i-1] + 1)", without the loop
+        steps = np.arange(len(edges))
+        edges = np.maximum.accumulate(edges - steps) + steps
+
+        self.num_valid = int(np.count_nonzero(edges[1:] <= self.freq_bins))
+        self.starts = edges[:self.num_valid]
+        self.stop = int(edges[self.num_valid]) if self.num_valid else 0
+
+        if window == 'hann':
+            self.window = np.hanning(fft_size).astype(np.float32)
+            window_gain = self.window.mean()
+        else:
+            self.window = None
+            window_gain = 1.0
+
+        bars = np.arange(self.num_valid)
+        widths = np.diff(edges[:self.num_valid + 1])
+        boost = 0.3 + (bars / num_bars) * 10
+        self.weights = (boost / widths / window_gain).astype(np.float32)
+
+    def map(self, samples, out=None):
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.window is not None:
+            samples = samples * self.window
+        magnitude = np.abs(np.fft.rfft(samples, n=self.fft_size, axis=-1))
+        return self.map_magnitude(magnitude, out)
+
+    def map_magnitude(self, magnitude, out=None):
+        if out is None:
+            out = np.zeros(magnitude.shape[:-1] + (self.num_bars,), dtype=np.float32)
+
+        if self.num_valid:
+            sums = np.add.reduceat(magnitude[..., :self.stop], self.starts, axis=-1)
+            np.multiply(sums, self.weights, out=out[..., :self.num_valid])
+        out[..., self.num_valid:] = 0
+        return out
+
+@lru_cache(maxsize=None)
+def get_band_mapper(fft_size, num_bars, sample_rate=44100, window='hann'):
+    return BandMapper(fft_size, num_bars, sample_rate, window)
+
+class SpectrumEngine:
+    # one windowed rfft over every stream's latest block at once; bars come back as (streams, num_bars)
+    def __init__(self, num_streams, fft_size=1024, num_bars=20, sample_rate=44100):
+        self.mapper = get_band_mapper(fft_size, num_bars, sample_rate)
+        self.frames = np.zeros((num_streams, fft_size), dtype=np.float32)
+        self.bars = np.zeros((num_streams, num_bars), dtype=np.float32)
+
+    def analyze(self):
+        return self.mapper.map(self.frames, out=self.bars)
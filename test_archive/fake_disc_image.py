@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+# writes a .bin/.cue pair of tone tracks, for --cd-image and bulk_import.py --image without a drive
+import argparse
+import os
+import numpy as np
+
+SAMPLE_RATE = 44100
+FRAMES_PER_SECTOR = 588
+
+parser = argparse.ArgumentParser()
+parser.add_argument("output", help="path of the .cue to write (the .bin goes next to it)")
+parser.add_argument("--tracks", type=int, default=12)
+parser.add_argument("--seconds", type=float, default=180, help="length of each track")
+args = parser.parse_args()
+
+bin_path = os.path.splitext(args.output)[0] + ".bin"
+sectors = int(args.seconds * SAMPLE_RATE) // FRAMES_PER_SECTOR
+frames = sectors * FRAMES_PER_SECTOR
+lines = [f'FILE "{os.path.basename(bin_path)}" BINARY']
+
+with open(bin_path, "wb") as f:
+    for track in range(1, args.tracks + 1):
+        offset = (track - 1) * sectors
+        minutes, rest = divmod(offset, 60 * 75)
+        seconds, sector = divmod(rest, 75)
+        lines += [f"  TRACK {track:02d} AUDIO", f"    INDEX 01 {minutes:02d}:{seconds:02d}:{sector:02d}"]
+
+        for start in range(0, frames, SAMPLE_RATE * 10):
+            t = (start + np.arange(min(SAMPLE_RATE * 10, frames - start))) / SAMPLE_RATE
+            tone = (0.3 * np.sin(2 * np.pi * 110 * track * t) * 32767).astype("<i2")
+            f.write(np.column_stack([tone, tone]).tobytes())
+
+with open(args.output, "w") as f:
+    f.write("\n".join(lines) + "\n")
+print(f"Wrote {args.tracks} tracks of {args.seconds:.0f} s to {bin_path}")
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# stands in for freaccmd.exe: writes a 16-bit WAV slowly, header first, like a real rip
+import argparse
+import struct
+import time
+import numpy as np
+
+SAMPLE_RATE = 44100
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--encoder")
+parser.add_argument("--drive")
+parser.add_argument("--track", type=int, default=1)
+parser.add_argument("-o", dest="output", required=True)
+parser.add_argument("--seconds", type=float, default=30)
+parser.add_argument("--speed", type=float, default=4, help="rip speed in x real time")
+args = parser.parse_args()
+
+total_frames = int(args.seconds * SAMPLE_RATE)
+chunk_frames = SAMPLE_RATE // 10
+
+with open(args.output, "wb") as f:
+    f.write(b"RIFF" + struct.pack("<I", 0) + b"WAVE")
+    f.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, 2, SAMPLE_RATE, SAMPLE_RATE * 4, 4, 16))
+    f.write(b"data" + struct.pack("<I", 0))
+    f.flush()
+
+    written = 0
+    while written < total_frames:
+        count = min(chunk_frames, total_frames - written)
+        t = (written + np.arange(count)) / SAMPLE_RATE
+        tone = (0.3 * np.sin(2 * np.pi * 220 * args.track * t) * 32767).astype("<i2")
+        f.write(np.column_stack([tone, tone]).tobytes())
+        f.flush()
+        written += count
+        time.sleep(count / SAMPLE_RATE / args.speed)
+
+    f.seek(4)
+    f.write(struct.pack("<I", 36 + total_frames * 4))
+    f.seek(40)
+    f.write(struct.pack("<I", total_frames * 4))
+
+print(f"Ripped track {args.track}")
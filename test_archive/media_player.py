@@ -1,69 +1,51 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
 import sys
-import numpy as np
-from PyQt6.QtWidgets import QApplication
-from visualizer import AudioVisualizer
-import soundfile as sf
-import sounddevice as sd
-
-SAMPLE_RATE = 44100
-CHUNK_SIZE = 1024
-
-class MediaPlayer:
-    def __init__(self, audio_file):
-        self.audio_file = audio_file
-        self.visualizer = None
-        self.stream = None
-        self.audio_data = None
-        self.position = 0
-
-    def load_audio(self):
-        self.audio_data, sr = sf.read(self.audio_file, always_2d=True)
-        print(f"Loaded audio file: {self.audio_file}")
-        print(f"Sample rate: {sr} Hz")
-        print(f"Duration: {len(self.audio_data) / sr:.2f} seconds")
-
-        if self.audio_data.shape[1] > 1:
-            self.audio_data_stereo = self.audio_data
-            self.audio_data_mono = np.mean(self.audio_data, axis=1)
-        else:
-            self.audio_data_stereo = np.column_stack([self.audio_data, self.audio_data])
-            self.audio_data_mono = self.audio_data.flatten()
-    
-    def audio_callback(self, outdata, frames, time, status):
-        if status:
-            print(status)
-        
-        chunk_stereo = self.audio_data_stereo[self.position:self.position + frames]
-        chunk_mono = self.audio_data_mono[self.position:self.position + frames]
-
-        if len(chunk_stereo) < frames:
-            chunk_stereo = np.pad(chunk_stereo, ((0, frames - len(chunk_stereo)), (0, 0)))
-            chunk_mono = np.pad(chunk_mono, (0, frames - len(chunk_mono)))
-            self.position = 0
-        else:
-            self.position += frames
-
-        outdata[:] = chunk_stereo
-
-        if self.visualizer:
-            self.visualizer.process_audio(chunk_mono)
-
-    def play(self):
-        self.stream = sd.OutputStream(
-            callback=self.audio_callback,
-            channels=2,
-            samplerate=SAMPLE_RATE,
-            blocksize=CHUNK_SIZE
-        )
-        self.stream.start()
-        print("Playback started.")
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from playback_engine import (PlaybackEngine, SoundDeviceOutput, NullOutput, FileOutput,
+                             TRACK_CHANGED, STATE_CHANGED, OUTPUT_STATUS)
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    player = MediaPlayer("test_audios/Kansas-City.mp3")
-    player.load_audio()
-    player.visualizer = AudioVisualizer(num_bars=20, smoothing=0.7)
-    player.play()
-    sys.exit(app.exec())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Play files through PlaybackEngine without a window")
+    parser.add_argument("files", nargs="*", default=["test_audios/Kansas-City.mp3"])
+    parser.add_argument("--null", action="store_true", help="render to nowhere instead of the sound card")
+    parser.add_argument("--out", help="render to this WAV file instead of the sound card")
+    parser.add_argument("--speed", type=float, default=1.0, help="render speed for --null/--out, 0 for as fast as possible")
+    parser.add_argument("--crossfade", type=float, default=0)
+    parser.add_argument("--normalize", action="store_true", help="level tracks to -18 LUFS behind a peak limiter")
+    args = parser.parse_args()
+
+    if args.out:
+        output = FileOutput(args.out, speed=args.speed)
+    elif args.null:
+        output = NullOutput(speed=args.speed)
+    else:
+        output = SoundDeviceOutput()
+
+    playlist = [{'path': path, 'title': os.path.basename(path)} for path in args.files]
+    engine = PlaybackEngine(lambda index, foreground: playlist[index]['path'], playlist, output, args.crossfade, args.normalize)
+    engine.load(0)
+    engine.play()
+
+    tracks_started = 0
+    try:
+        while True:
+            for event, value in engine.poll_events():
+                if event == TRACK_CHANGED:
+                    tracks_started += 1
+                    if tracks_started > len(playlist):
+                        raise KeyboardInterrupt
+                    print(f"Playing {playlist[value]['title']}")
+                elif event == STATE_CHANGED:
+                    print(f"Playback {value}")
+                elif event == OUTPUT_STATUS:
+                    print(value)
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+
+    print(f"{engine.underflows} output underflows")
+    engine.close()
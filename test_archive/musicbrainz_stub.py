@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# local stand-in for the MusicBrainz web service, run the player with MUSICBRAINZ_HOST=localhost:8080
+import argparse
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--port", type=int, default=8080)
+parser.add_argument("--tracks", type=int, default=12)
+parser.add_argument("--disc-ids", default="", help="comma separated disc IDs, one per medium of the box set")
+parser.add_argument("--delay", type=float, default=0, help="seconds to stall before answering")
+parser.add_argument("--deny", action="store_true", help="answer every query with 503")
+args = parser.parse_args()
+
+disc_ids = [disc_id for disc_id in args.disc_ids.split(",") if disc_id]
+
+def medium_xml(position, disc_id):
+    tracks = "".join(
+        f'<track id="track-{position}-{n}"><position>{n}</position><number>{n}</number>'
+        f'<recording id="recording-{position}-{n}"><title>Stub Song {position}-{n}</title></recording></track>'
+        for n in range(1, args.tracks + 1)
+    )
+    disc_list = f'<disc-list count="1"><disc id="{disc_id}"/></disc-list>' if disc_id else ""
+    return (
+        f'<medium><position>{position}</position>{disc_list}'
+        f'<track-list count="{args.tracks}" offset="0">{tracks}</track-list></medium>'
+    )
+
+def release_xml(queried_disc_id=None):
+    ids = disc_ids or [queried_disc_id]
+    mediums = "".join(
+        # a discid lookup only lists the queried disc, like the real service without inc=discids
+        medium_xml(position, disc_id if queried_disc_id in (None, disc_id) else None)
+        for position, disc_id in enumerate(ids, start=1)
+    )
+    return (
+        '<release id="stub-release"><title>Stub Album</title>'
+        '<artist-credit><name-credit><artist id="stub-artist"><name>Stub Artist</name></artist></name-credit></artist-credit>'
+        f'<medium-list count="{len(ids)}">{mediums}</medium-list></release>'
+    )
+
+def document(body):
+    return '<?xml version="1.0" encoding="UTF-8"?><metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">' + body + '</metadata>'
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(args.delay)
+        resource = self.path.split("?")[0]
+        if args.deny or not resource.startswith(("/ws/2/discid/", "/ws/2/release/")):
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if resource.startswith("/ws/2/discid/"):
+            disc_id = resource.rsplit("/", 1)[-1]
+            body = f'<disc id="{disc_id}"><release-list count="1">{release_xml(disc_id)}</release-list></disc>'
+        else:
+            body = release_xml()
+        body = document(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+print(f"MusicBrainz stub listening on localhost:{args.port}")
+HTTPServer(("localhost", args.port), StubHandler).serve_forever()
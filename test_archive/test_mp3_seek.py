@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# seeks IndexedMp3Source around mp3s (a CBR and a VBR chirp by default) and compares what it reads
+# against a full decode of the same file
+import os
+import sys
+import tempfile
+import numpy as np
+import soundfile as sf
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("EXPEDITION_AUDIO_CACHE", tempfile.mkdtemp())
+from seek_index import IndexedMp3Source, get_seek_index
+
+SAMPLE_RATE = 44100
+SECONDS = 20
+READ_FRAMES = 997
+CHECK_FRAMES = 6000
+TOLERANCE = 1e-6
+
+def write_chirps():
+    t = np.arange(SECONDS * SAMPLE_RATE) / SAMPLE_RATE
+    chirp = 0.3 * np.sin(2 * np.pi * (200 * t + 300 * t * t))
+    paths = []
+    for mode in ('CONSTANT', 'VARIABLE'):
+        path = os.path.join(tempfile.gettempdir(), f"seek_chirp_{mode.lower()}.mp3")
+        sf.write(path, np.column_stack([chirp, chirp * 0.7]), SAMPLE_RATE, format='MP3', bitrate_mode=mode)
+        paths.append(path)
+    return paths
+
+def check(path):
+    reference = sf.read(path, dtype='float32', always_2d=True)[0]
+    total = len(reference)
+    get_seek_index(path)
+    source = IndexedMp3Source(path)
+    if source.frames != total:
+        print(f"{path}: {source.frames} frames, full decode has {total}")
+        return False
+
+    offsets = [0, 1000, 220623, 300000, 529200, 700001, total - 3000, total - 1] + list(range(5000, total, total // 23))
+    failures = 0
+    for frame in sorted(offset for offset in set(offsets) if 0 <= offset < total):
+        source.seek(frame)
+        blocks = []
+        wanted = min(CHECK_FRAMES, total - frame)
+        while sum(len(block) for block in blocks) < wanted:
+            block = source.read(READ_FRAMES)
+            if not len(block):
+                break
+            blocks.append(block)
+        got = np.concatenate(blocks)[:wanted] if blocks else np.zeros((0, reference.shape[1]), dtype=np.float32)
+        if len(got) != wanted:
+            print(f"  seek to {frame}: read {len(got)} of {wanted} frames")
+            failures += 1
+            continue
+        error = np.abs(got - reference[frame:frame + wanted]).max(axis=1)
+        bad = np.nonzero(error > TOLERANCE)[0]
+        if len(bad):
+            print(f"  seek to {frame}: {len(bad)} wrong samples (first {bad[0]}, max error {error.max():.3f})")
+            failures += 1
+    source.close()
+
+    print(f"{path}: {'ok' if not failures else f'{failures} bad seeks'} ({len(offsets)} offsets, "
+          f"{'gapless' if source.index.gapless else 'no gapless info'})")
+    return not failures
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or write_chirps()
+    results = [check(path) for path in paths]
+    sys.exit(0 if all(results) else 1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from audio_stream import StreamingDecoder, GrowingWavSource
+
+SAMPLE_RATE = 44100
+CHUNK_SIZE = 1024
+SECONDS = 20
+
+output_path = os.path.join(tempfile.gettempdir(), "fake_track_01.wav")
+if os.path.exists(output_path):
+    os.remove(output_path)
+
+ripper = subprocess.Popen([
+    sys.executable, os.path.join(os.path.dirname(__file__), "fake_ripper.py"),
+    "--track=1", "-o", output_path, f"--seconds={SECONDS}", "--speed=2"
+])
+
+start = time.monotonic()
+source = GrowingWavSource(output_path, lambda: ripper.poll() is not None, SECONDS * SAMPLE_RATE)
+if not source.wait_ready():
+    print("Ripper never produced enough audio")
+    sys.exit(1)
+print(f"Playback could start after {time.monotonic() - start:.2f} s")
+
+decoder = StreamingDecoder(source)
+block = np.zeros((CHUNK_SIZE, 2), dtype=np.float32)
+played = 0
+underruns = 0
+while not decoder.finished:
+    count = decoder.read_into(block)
+    if count < CHUNK_SIZE and not decoder.finished:
+        underruns += 1
+    played += count
+    time.sleep(CHUNK_SIZE / SAMPLE_RATE)
+
+decoder.close()
+ripper.wait()
+print(f"Played {played / SAMPLE_RATE:.2f} s of {SECONDS} s with {underruns} underruns")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import soundfile as sf
+from app_paths import get_cache_dir
+
+ANALYSIS_WORKERS = 2
+ANALYSIS_BLOCK_SECONDS = 6
+REFERENCE_LOUDNESS = -18.0
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# overlap-save keeps this much of the previous hop; the K-weighting response has died out long before
+FILTER_HISTORY_FRAMES = 2048
+TRUE_PEAK_OVERSAMPLE = 4
+TRUE_PEAK_TAPS = 12
+WAVEFORM_BIN_FRAMES = 512
+WAVEFORM_LEVELS = 4
+WAVEFORM_LEVEL_STEP = 4
+ESTIMATE_EXCERPTS = 12
+ESTIMATE_EXCERPT_SECONDS = 1.0
+SUMMARY_FIELDS = ('loudness', 'true_peak', 'sample_peak', 'frames', 'samplerate')
+
+def k_weighting_response(samplerate, fft_size):
+    # BS.1770 pre-filter (high shelf) and RLB high-pass, with coefficients derived for any rate
+    # the same way libebur128 does, evaluated on the rfft bins
+    k = np.tan(np.pi * 1681.974450955533 / samplerate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    k = np.tan(np.pi * 38.13547087602444 / samplerate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass_b = [1.0, -2.0, 1.0]
+    highpass_a = [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    z = np.exp(-1j * np.pi * np.arange(fft_size // 2 + 1) / (fft_size // 2))
+    def biquad(b, a):
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return biquad(shelf_b, shelf_a) * biquad(highpass_b, highpass_a)
+
+class LoudnessMeter:
+    def __init__(self, samplerate, channels):
+        self.hop = samplerate // 10
+        self.fft_size = 1 << int(np.ceil(np.log2(self.hop + FILTER_HISTORY_FRAMES)))
+        self.response = k_weighting_response(samplerate, self.fft_size)
+        # BS.1770 channel weights in L R C LFE Ls Rs order: the surrounds (5th and 6th) count 1.41x, the LFE
+        # (4th) not at all
+        self.weights = np.ones(channels)
+        if channels == 6:
+            self.weights[3] = 0.0
+            self.weights[4:] = 1.41
+        self.history = np.zeros((self.fft_size - self.hop, channels), dtype=np.float32)
+        self.pending = np.zeros((0, channels), dtype=np.float32)
+        self.hop_energy = []
+
+    def process(self, block):
+        data = np.concatenate((self.pending, block))
+        hops = len(data) // self.hop
+        self.pending = data[hops * self.hop:]
+        if not hops:
+            return
+
+        frames = np.concatenate((self.history, data[:hops * self.hop]))
+        self.history = frames[len(frames) - len(self.history):]
+        windows = np.lib.stride_tricks.sliding_window_view(frames, self.fft_size, axis=0)[::self.hop]
+        # overlap-save: filter every 100 ms hop at once and keep only the samples free of wrap-around
+        filtered = np.fft.irfft(np.fft.rfft(windows, axis=-1) * self.response, n=self.fft_size, axis=-1)
+        valid = filtered[..., self.fft_size - self.hop:]
+        self.hop_energy.append(np.einsum('hcn,hcn->hc', valid, valid) / self.hop)
+
+    def integrated(self):
+        if not self.hop_energy:
+            return float('-inf')
+        energy = np.concatenate(self.hop_energy) @ self.weights
+        if len(energy) < 4:
+            return float('-inf')
+
+        # 400 ms gating blocks with 75% overlap are four consecutive hops
+        blocks = (energy[:-3] + energy[1:-2] + energy[2:-1] + energy[3:]) / 4
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[loudness > ABSOLUTE_GATE]
+        if not len(gated):
+            return float('-inf')
+        threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+        gated = blocks[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def true_peak_phases(oversample=TRUE_PEAK_OVERSAMPLE, taps=TRUE_PEAK_TAPS):
+    length = oversample * taps
+    n = np.arange(length) - (length - 1) / 2
+    window = np.i0(8.6 * np.sqrt(np.clip(1 - (2 * n / length) ** 2, 0, 1))) / np.i0(8.6)
+    prototype = np.sinc(n / oversample) * window
+    phases = prototype.reshape(taps, oversample).T
+    return phases / phases.sum(axis=1, keepdims=True)
+
+class PeakMeter:
+    def __init__(self, channels):
+        self.phases = true_peak_phases()
+        self.history = np.zeros((self.phases.shape[1] - 1, channels), dtype=np.float32)
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+
+    def process(self, block):
+        if len(block):
+            self.sample_peak = max(self.sample_peak, float(np.abs(block).max()))
+        data = np.concatenate((self.history, block))
+        self.history = data[len(data) - len(self.history):]
+        if len(data) < self.phases.shape[1]:
+            return
+        windows = np.lib.stride_tricks.sliding_window_view(data, self.phases.shape[1], axis=0)
+        # every oversampled phase of every channel in one product: (frames, channels, phases)
+        upsampled = windows @ self.phases.T.astype(np.float32)
+        self.true_peak = max(self.true_peak, float(np.abs(upsampled).max()))
+
+    def finish(self):
+        self.process(np.zeros((self.phases.shape[1] - 1, self.history.shape[1]), dtype=np.float32))
+        return max(self.true_peak, self.sample_peak), self.sample_peak
+
+class WaveformBuilder:
+    def __init__(self, bin_frames=WAVEFORM_BIN_FRAMES):
+        self.bin_frames = bin_frames
+        self.pending_low = np.zeros(0, dtype=np.float32)
+        self.pending_high = np.zeros(0, dtype=np.float32)
+        self.bins = []
+
+    def process(self, block):
+        # min and max across channels, so a one-sided channel still shows
+        low = block[:, 0].copy()
+        high = low.copy()
+        for channel in range(1, block.shape[1]):
+            np.minimum(low, block[:, channel], out=low)
+            np.maximum(high, block[:, channel], out=high)
+
+        low = np.concatenate((self.pending_low, low))
+        high = np.concatenate((self.pending_high, high))
+        count = len(low) // self.bin_frames
+        used = count * self.bin_frames
+        self.pending_low, self.pending_high = low[used:], high[used:]
+        if count:
+            self._add(low[:used].reshape(count, -1), high[:used].reshape(count, -1))
+
+    def _add(self, low, high):
+        self.bins.append(np.stack((low.min(axis=1), high.max(axis=1)), axis=1))
+
+    def finish(self):
+        if len(self.pending_low):
+            self._add(self.pending_low[None], self.pending_high[None])
+        level = np.concatenate(self.bins) if self.bins else np.zeros((0, 2), dtype=np.float32)
+
+        levels = {}
+        bin_frames = self.bin_frames
+        for _ in range(WAVEFORM_LEVELS):
+            levels[bin_frames] = np.clip(np.round(level * 127), -127, 127).astype(np.int8)
+            if len(level) <= 1:
+                break
+            starts = np.arange(0, len(level), WAVEFORM_LEVEL_STEP)
+            level = np.stack((np.minimum.reduceat(level[:, 0], starts), np.maximum.reduceat(level[:, 1], starts)), axis=1)
+            bin_frames *= WAVEFORM_LEVEL_STEP
+        return levels
+
+class TrackAnalysis:
+    def __init__(self, loudness, true_peak, sample_peak, frames, samplerate, waveform):
+        self.loudness = loudness
+        self.true_peak = true_peak
+        self.sample_peak = sample_peak
+        self.frames = int(frames)
+        self.samplerate = int(samplerate)
+        self.waveform = waveform
+
+    @property
+    def gain_db(self):
+        return loudness_gain_db(self.loudness)
+
+    @property
+    def true_peak_db(self):
+        return 20 * np.log10(self.true_peak) if self.true_peak > 0 else float('-inf')
+
+    def overview(self, width):
+        # the coarsest level that still has a bin per pixel, as floats in [-1, 1]
+        levels = sorted(self.waveform.items())
+        chosen = levels[0][1]
+        for _, level in levels:
+            if len(level) < width:
+                break
+            chosen = level
+        return chosen.astype(np.float32) / 127
+
+def loudness_gain_db(loudness):
+    if not np.isfinite(loudness):
+        return 0.0
+    return REFERENCE_LOUDNESS - loudness
+
+def open_analysis_source(path):
+    if path.lower().endswith('.wav'):
+        from audio_stream import WavMemmapSource
+        try:
+            return WavMemmapSource(path)
+        except ValueError:
+            pass
+    if path.lower().endswith('.mp3'):
+        from seek_index import IndexedMp3Source
+        return IndexedMp3Source(path)
+    return sf.SoundFile(path)
+
+def analyze_track(path):
+    source = open_analysis_source(path)
+    try:
+        samplerate, channels = source.samplerate, source.channels
+        loudness = LoudnessMeter(samplerate, channels)
+        peaks = PeakMeter(channels)
+        waveform = WaveformBuilder()
+
+        block_frames = ANALYSIS_BLOCK_SECONDS * samplerate
+        frames = 0
+        while True:
+            block = source.read(block_frames, dtype='float32', always_2d=True)
+            if not len(block):
+                break
+            frames += len(block)
+            loudness.process(block)
+            peaks.process(block)
+            waveform.process(block)
+    finally:
+        source.close()
+
+    true_peak, sample_peak = peaks.finish()
+    return TrackAnalysis(loudness.integrated(), true_peak, sample_peak, frames, samplerate, waveform.finish())
+
+def estimate_loudness(path, excerpts=ESTIMATE_EXCERPTS, seconds=ESTIMATE_EXCERPT_SECONDS):
+    # gated loudness of short excerpts spread over the track; within a dB or so of the full
+    # measurement for most music, at a few percent of the decoding work
+    source = open_analysis_source(path)
+    try:
+        excerpt_frames = int(seconds * source.samplerate)
+        meter = LoudnessMeter(source.samplerate, source.channels)
+        starts = np.linspace(0, max(0, source.frames - excerpt_frames), excerpts).astype(np.int64)
+        for start in np.unique(starts).tolist():
+            source.seek(start)
+            meter.process(source.read(excerpt_frames, dtype='float32', always_2d=True))
+    finally:
+        source.close()
+    return meter.integrated()
+
+class AnalysisStore:
+    def __init__(self, root=None):
+        self.root = root or get_cache_dir("analysis")
+        self.discs = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def path(self, disc_id):
+        return os.path.join(self.root, f"{disc_id}.npz")
+
+    def get(self, disc_id, track_number):
+        with self.lock:
+            return self._disc(disc_id).get(track_number)
+
+    def put(self, disc_id, track_number, analysis):
+        # held until flush, so a batch of tracks rewrites the disc's file once rather than once per track
+        with self.lock:
+            self._disc(disc_id)[track_number] = analysis
+            self.dirty.add(disc_id)
+
+    def flush(self, disc_id=None):
+        with self.lock:
+            disc_ids = sorted(self.dirty) if disc_id is None else [disc_id]
+            for disc_id in disc_ids:
+                if disc_id in self.dirty and self._save(disc_id):
+                    self.dirty.discard(disc_id)
+
+    def _disc(self, disc_id):
+        disc = self.discs.get(disc_id)
+        if disc is None:
+            disc = self.discs[disc_id] = self._load(disc_id)
+        return disc
+
+    def _load(self, disc_id):
+        disc = {}
+        try:
+            with np.load(self.path(disc_id)) as saved:
+                for track_number, summary in zip(saved['tracks'].tolist(), saved['summary']):
+                    prefix = f"wave_{track_number:02d}_"
+                    waveform = {int(name[len(prefix):]): saved[name] for name in saved.files if name.startswith(prefix)}
+                    disc[track_number] = TrackAnalysis(*summary.tolist(), waveform)
+        except (OSError, KeyError, ValueError) as e:
+            if os.path.exists(self.path(disc_id)):
+                print(f"Could not read track analysis for {disc_id}: {e}")
+        return disc
+
+    def _save(self, disc_id):
+        disc = self.discs[disc_id]
+        tracks = sorted(disc)
+        arrays = {
+            'tracks': np.array(tracks, dtype=np.int32),
+            'summary': np.array([[getattr(disc[t], field) for field in SUMMARY_FIELDS] for t in tracks], dtype=np.float64),
+        }
+        for track_number in tracks:
+            for bin_frames, level in disc[track_number].waveform.items():
+                arrays[f"wave_{track_number:02d}_{bin_frames}"] = level
+
+        path = self.path(disc_id)
+        staging = path + ".tmp"
+        try:
+            with open(staging, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(staging, path)
+        except OSError as e:
+            print(f"Could not save track analysis for {disc_id}: {e}")
+            return False
+        return True
+
+class TrackAnalyzer:
+    def __init__(self, store=None, workers=ANALYSIS_WORKERS):
+        self.store = store or AnalysisStore()
+        self.workers = workers
+        self.pool = None
+        self.pending = set()
+        self.on_done = None
+        self.lock = threading.Lock()
+
+    def submit(self, disc_id, track_number, path):
+        key = (disc_id, track_number)
+        with self.lock:
+            if key in self.pending or self.store.get(disc_id, track_number) is not None:
+                return
+            if not self.pool:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+            self.pending.add(key)
+            future = self.pool.submit(analyze_track, path)
+
+        def analyzed(done):
+            analysis = None
+            if not done.cancelled():
+                try:
+                    analysis = done.result()
+                except Exception as e:
+                    print(f"Analysis of {disc_id} track {track_number} failed: {e}")
+            if analysis is not None:
+                self.store.put(disc_id, track_number, analysis)
+            with self.lock:
+                self.pending.discard(key)
+                disc_done = not any(pending_disc == disc_id for pending_disc, _ in self.pending)
+            # the disc's file is written once the tracks submitted with this one are all in
+            if disc_done:
+                self.store.flush(disc_id)
+            if analysis is None:
+                return
+            print(f"Analyzed {disc_id} track {track_number}: {analysis.loudness:.1f} LUFS, "
+                  f"true peak {analysis.true_peak_db:.1f} dBTP")
+            if self.on_done:
+                self.on_done(disc_id, track_number)
+
+        future.add_done_callback(analyzed)
+
+    def submit_cached(self, cache, disc_id):
+        for track_number, path in sorted(cache.cached_tracks(disc_id).items()):
+            self.submit(disc_id, track_number, path)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        self.store.flush()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: track_analysis.py FILE...")
+    with ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS) as pool:
+        for path, analysis in zip(sys.argv[1:], pool.map(analyze_track, sys.argv[1:])):
+            print(f"{path}: {analysis.loudness:.2f} LUFS (gain {analysis.gain_db:+.2f} dB), "
+                  f"true peak {analysis.true_peak_db:.2f} dBTP, sample peak {analysis.sample_peak:.4f}")
@@ -1,36 +1,149 @@
+import time
 import numpy as np
 import pyqtgraph as pg
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QTimer
+from PyQt6.QtCore import Qt, QTimer, QRectF
+from PyQt6.QtGui import QBrush, QColor
+from spectrum import get_band_mapper
+
+class SampleTap:
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.write_index = 0
+        self._views = {}
+        self._view_frames = 0
+
+    def push(self, samples):
+        # this runs in the audio callback: full blocks on the grid go through views made once per block
+        # size, a slice would allocate an array every call
+        if len(samples) and len(samples) <= self.capacity:
+            window = self._window(self.write_index % self.capacity, len(samples))
+            if window is not None:
+                np.copyto(window, samples)
+                self.write_index += len(samples)
+                return
+
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            count = self.capacity
+
+        start = self.write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        self.data[:count - first] = samples[first:]
+        self.write_index += len(samples)
+
+    def _window(self, start, frames):
+        if frames != self._view_frames:
+            self._make_views(frames)
+        return self._views.get(start)
+
+    def _make_views(self, frames):
+        self._view_frames = frames
+        self._views = {offset: self.data[offset:offset + frames]
+                       for offset in range(0, self.capacity - frames + 1, frames)}
+
+    def latest(self, out):
+        end = self.write_index
+        count = min(len(out), end, self.capacity)
+        start = (end - count) % self.capacity
+        first = min(count, self.capacity - start)
+        out[:len(out) - count] = 0
+        out[len(out) - count:len(out) - count + first] = self.data[start:start + first]
+        out[len(out) - count + first:] = self.data[:count - first]
+        return end
+
+    def clear(self):
+        self.write_index = 0
+
+MAX_HEIGHT = 480
+FRAME_RATE = 60
+# the smoothing factor was tuned for 50 ms frames; scale it so bars decay at the same speed at any frame rate
+SMOOTHING_FRAME_SECONDS = 0.05
+
+class FrameClock:
+    def __init__(self, frame_rate=FRAME_RATE):
+        self.interval = 1 / frame_rate
+        self.next_frame = 0.0
+        self.skipped_frames = 0
+
+    def tick(self):
+        now = time.perf_counter()
+        if now < self.next_frame - self.interval / 2:
+            return 0
+        # when the UI thread fell behind, draw the latest state once instead of replaying missed frames
+        frames = 1
+        if now - self.next_frame < self.interval * 4:
+            frames += int((now - self.next_frame) / self.interval)
+            self.skipped_frames += frames - 1
+            self.next_frame += frames * self.interval
+        else:
+            self.next_frame = now + self.interval
+        return frames
+
+    def start_timer(self, callback):
+        timer = QTimer()
+        timer.setTimerType(Qt.TimerType.PreciseTimer)
+        timer.timeout.connect(callback)
+        timer.start(int(self.interval * 1000))
+        return timer
+
+class BarItem(pg.GraphicsObject):
+    def __init__(self, num_bars, width=0.8, colors=()):
+        super().__init__()
+        self.num_bars = num_bars
+        self.heights = np.zeros(num_bars)
+        # one rectangle per bar, allocated once and resized in place; filling axis-aligned rects
+        # with a solid brush is far cheaper than rebuilding or rasterizing a general path
+        self.rects = [QRectF(i - width / 2, 0, width, 0) for i in range(num_bars)]
+
+        self.brushes = [QBrush(QColor(*color)) for color in colors]
+
+    def set_heights(self, heights):
+        for rect, height in zip(self.rects, heights.tolist()):
+            rect.setHeight(height)
+        self.heights[:] = heights
+        self.update()
+
+    def boundingRect(self):
+        return QRectF(-0.5, 0, self.num_bars, MAX_HEIGHT)
+
+    def paint(self, painter, *args):
+        for rect, brush in zip(self.rects, self.brushes):
+            painter.fillRect(rect, brush)
 
 class AudioVisualizer:
-    def __init__(self, num_bars=20, smoothing=0.7, sample_rate=44100):
+    def __init__(self, num_bars=20, smoothing=0.7, sample_rate=44100, fft_size=1024, frame_rate=FRAME_RATE,
+                 title="Audio Visualizer"):
         self.num_bars = num_bars
         self.smoothing = smoothing
         self.sample_rate = sample_rate
         self.bar_heights = np.zeros(num_bars)
+        self.tap = SampleTap(fft_size * 8)
+        self.window = np.zeros(fft_size, dtype=np.float32)
+        self.analyzed_index = 0
+        self.band_mapper = get_band_mapper(fft_size, num_bars, sample_rate)
+
+        self.clock = FrameClock(frame_rate)
+        self.frame_smoothing = smoothing ** (self.clock.interval / SMOOTHING_FRAME_SECONDS)
+        self.display_heights = np.zeros(num_bars)
+        self.target_heights = np.zeros(num_bars)
 
-        self.win = pg.plot(title="Audio Visualizer")
+        self.win = pg.plot(title=title)
         self.win.setYRange(0, 500)
         self.win.setXRange(0, num_bars)
         self.win.setBackground('k')
         self.win.hideAxis('left')
         self.win.hideAxis('bottom')
         self.win.showGrid(x=False, y=False)
+        self.win.setMouseEnabled(x=False, y=False)
 
-        colors = self._create_colors()
+        self.bars = BarItem(num_bars, colors=self._create_colors())
+        self.win.addItem(self.bars)
 
-        self.bar_graph = pg.BarGraphItem(
-            x=range(num_bars),
-            height=self.bar_heights,
-            width=0.8,
-            brushes=colors
-        )
-        self.win.addItem(self.bar_graph)
-
-        self.timer = QTimer()
-        self.timer.timeout.connect(self._update_display)
-        self.timer.start(50)
+        self.timer = self.clock.start_timer(self._on_frame)
 
     def _create_colors(self):
         colors = []
@@ -61,33 +174,37 @@ class AudioVisualizer:
         return colors
 
     def process_audio(self, audio_data):
-        fft_data = np.fft.rfft(audio_data)
-        fft_magnitude = np.abs(fft_data)
+        self.tap.push(audio_data)
 
-        freq_bins = len(fft_magnitude)
-        log_indices = np.logspace(np.log10(2), np.log10(freq_bins), self.num_bars, dtype=int)
-        log_indices = np.concatenate(([0], log_indices))
+    def reset(self):
+        self.tap.clear()
+        self.analyzed_index = 0
+        self.bar_heights = np.zeros(self.num_bars)
 
-        for i in range(1, len(log_indices)):
-            if log_indices[i] <= log_indices[i-1]:
-                log_indices[i] = log_indices[i-1] + 1
+    def _analyze(self, audio_data):
+        self.bar_heights = self.band_mapper.map(audio_data)
 
-        new_heights = []
-        for i in range(self.num_bars):
-            start = log_indices[i]
-            end = log_indices[i + 1]
-            if start < end and end <= freq_bins:
-                avg = np.mean(fft_magnitude[start:end])
-                boost = 0.3 + (i / self.num_bars) * 10
-                new_heights.append(avg * boost)
-            else:
-                new_heights.append(0)
-        
-        self.bar_heights = np.array(new_heights)
-
-    def _update_display(self):
-        current_heights = self.bar_graph.opts['height']
-        target_heights = self.bar_heights * 3
-        smoothed_heights = current_heights * self.smoothing + target_heights * (1 - self.smoothing)
-        smoothed_heights = np.clip(smoothed_heights, 0, 480)
-        self.bar_graph.setOpts(height=smoothed_heights)
\ No newline at end of file
+    def _on_frame(self):
+        frames = self.clock.tick()
+        if frames:
+            self._update_display(frames)
+
+    def _update_display(self, frames=1):
+        if self.tap.write_index != self.analyzed_index:
+            self.analyzed_index = self.tap.latest(self.window)
+            self._analyze(self.window)
+        self.show_heights(self.bar_heights, frames)
+
+    def show_heights(self, heights, frames=1):
+        smoothing = self.frame_smoothing ** frames
+        target = self.target_heights
+        np.multiply(heights, 3 * (1 - smoothing), out=target)
+        np.multiply(self.display_heights, smoothing, out=self.display_heights)
+        np.add(self.display_heights, target, out=self.display_heights)
+        np.clip(self.display_heights, 0, MAX_HEIGHT, out=self.display_heights)
+
+        # idle (paused or silent) bars settle to the same values; skip the repaint then
+        np.subtract(self.display_heights, self.bars.heights, out=target)
+        np.abs(target, out=target)
+        if target.max() >= 0.05:
+            self.bars.set_heights(self.display_heights)
@@ -0,0 +1,45 @@
+import numpy as np
+from PyQt6.QtWidgets import QSlider
+from PyQt6.QtCore import Qt, QLineF
+from PyQt6.QtGui import QPainter, QColor, QPen
+
+WAVEFORM_COLOR = QColor(90, 140, 255, 140)
+
+class WaveformSlider(QSlider):
+    def __init__(self, orientation=Qt.Orientation.Horizontal, parent=None):
+        super().__init__(orientation, parent)
+        self.analysis = None
+        self.lines = []
+        self.lines_size = None
+        self.setMinimumHeight(36)
+
+    def set_waveform(self, analysis):
+        self.analysis = analysis
+        self.lines = []
+        self.lines_size = None
+        self.update()
+
+    def _build_lines(self):
+        width, height = self.width(), self.height()
+        self.lines_size = (width, height)
+        overview = self.analysis.overview(width)
+        if not len(overview) or width <= 0:
+            self.lines = []
+            return
+
+        columns = np.arange(width)
+        bins = np.minimum(columns * len(overview) // width, len(overview) - 1)
+        middle = height / 2
+        top = middle - overview[bins, 1] * middle
+        bottom = middle - overview[bins, 0] * middle
+        self.lines = [QLineF(x + 0.5, y0, x + 0.5, y1) for x, y0, y1 in zip(columns.tolist(), top.tolist(), bottom.tolist())]
+
+    def paintEvent(self, event):
+        if self.analysis is not None:
+            if self.lines_size != (self.width(), self.height()):
+                self._build_lines()
+            painter = QPainter(self)
+            painter.setPen(QPen(WAVEFORM_COLOR, 1))
+            painter.drawLines(self.lines)
+            painter.end()
+        super().paintEvent(event)